@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import sys
+from array import array
+from operator import mul
+from typing import Dict, List, NamedTuple, Optional
+
+# Weight of a mark in the average by assignment type. Grade reports do not
+# carry the school's own weights, so these are the usual ones; set
+# "mark_weights" in the config to match your school. Other types weigh 1.
+DEFAULT_WEIGHTS = {
+    'Контрольная работа': 2.0,
+    'Проверочная работа': 1.5,
+    'Самостоятельная работа': 1.5,
+    'Практическая работа': 1.5,
+    'Лабораторная работа': 1.5,
+    'Диктант': 1.5,
+    'Сочинение': 1.5,
+    'Изложение': 1.5,
+    'Тест': 1.5,
+}
+MAX_MARK = 5
+# 4.5 and up rounds to a 5 at the end of the term
+DEFAULT_TARGET = 4.5
+
+class SubjectStats(NamedTuple):
+    subject: str
+    marks: int
+    average: float
+    weighted_average: float
+    # Change of the mark per 30 days, from a least squares line over the dates
+    trend: float
+    # Marks of `mark` (weighing `weight`) still needed to reach the target;
+    # 0 if it is reached, None if it cannot be
+    needed: Optional[int]
+    by_type: Dict[str, float]
+
+class GradeTable:
+    """Marks of many subjects as columns: one array per field, one row per mark.
+
+    Rows are appended in segments of one subject and one assignment type, so
+    every aggregate is a few C-level sums over array slices instead of a
+    Python loop over Assignment objects.
+    """
+
+    def __init__(self, weights=None):
+        self.weights = DEFAULT_WEIGHTS if weights is None else weights
+        self.subjects: List[str] = []
+        self.types: List[str] = []
+        self._subject_index: Dict[str, int] = {}
+        self._type_index: Dict[str, int] = {}
+        self.mark = array('d')
+        self.weight = array('d')
+        # Days since `base`, the date of the first mark added
+        self.day = array('d')
+        self.base: Optional[datetime.date] = None
+        # (subject index, type index, first row, end row)
+        self.segments: List[tuple] = []
+
+    def __len__(self):
+        return len(self.mark)
+
+    @classmethod
+    def from_grades(cls, grades_by_subject, weights=None):
+        """Build a table from {subject: Grades}, e.g. the result of reports.load_grades."""
+        table = cls(weights)
+        for subject, grades in grades_by_subject.items():
+            table.add(subject, grades.assignments)
+        return table
+
+    def add(self, subject, assignments):
+        """Append the marked assignments of one subject; unmarked and undated ones are skipped."""
+        by_type = {}
+        for assignment in assignments:
+            when = assignment.date or assignment.issue_date
+            if assignment.mark and when:
+                by_type.setdefault(assignment.type, []).append((assignment.mark, when.toordinal()))
+        if subject not in self._subject_index:
+            self._subject_index[subject] = len(self.subjects)
+            self.subjects.append(subject)
+        for kind, rows in by_type.items():
+            if kind not in self._type_index:
+                self._type_index[kind] = len(self.types)
+                self.types.append(kind)
+            if self.base is None:
+                self.base = datetime.date.fromordinal(rows[0][1])
+            base = self.base.toordinal()
+            start = len(self.mark)
+            self.mark.extend(mark for mark, _ in rows)
+            self.day.extend(day - base for _, day in rows)
+            self.weight.extend([self.weights.get(kind, 1.0)] * len(rows))
+            self.segments.append((self._subject_index[subject], self._type_index[kind], start, len(self.mark)))
+
+def needed_marks(total, weights, target, mark=MAX_MARK, weight=1.0):
+    """Return how many marks of `mark` bring sum(w*m) / sum(w) up to `target`."""
+    if weights and total / weights >= target - 1e-9:
+        return 0
+    if mark <= target:
+        return None
+    return max(1, math.ceil((target * weights - total) / (weight * (mark - target)) - 1e-9))
+
+def analyze(table, target=DEFAULT_TARGET, mark=MAX_MARK, weight=1.0):
+    """Return SubjectStats for every subject of the table, in one batch."""
+    subjects = len(table.subjects)
+    # Per subject: count, Σm, Σw, Σwm, Σx, Σx², Σxm (x is the day)
+    sums = [array('d', bytes(8 * subjects)) for _ in range(7)]
+    by_type = [{} for _ in range(subjects)]
+    for subject, kind, start, end in table.segments:
+        marks = table.mark[start:end]
+        weights = table.weight[start:end]
+        days = table.day[start:end]
+        mark_sum = sum(marks)
+        for column, value in zip(sums, (
+            end - start,
+            mark_sum,
+            sum(weights),
+            sum(map(mul, weights, marks)),
+            sum(days),
+            sum(map(mul, days, days)),
+            sum(map(mul, days, marks)),
+        )):
+            column[subject] += value
+        count, total = by_type[subject].get(table.types[kind], (0, 0.0))
+        by_type[subject][table.types[kind]] = (count + end - start, total + mark_sum)
+
+    n, sum_m, sum_w, sum_wm, sum_x, sum_xx, sum_xm = sums
+    stats = []
+    for i, subject in enumerate(table.subjects):
+        spread = n[i] * sum_xx[i] - sum_x[i] ** 2
+        stats.append(SubjectStats(
+            subject=subject,
+            marks=int(n[i]),
+            average=sum_m[i] / n[i] if n[i] else 0.0,
+            weighted_average=sum_wm[i] / sum_w[i] if sum_w[i] else 0.0,
+            trend=30 * (n[i] * sum_xm[i] - sum_x[i] * sum_m[i]) / spread if spread > 1e-9 else 0.0,
+            needed=needed_marks(sum_wm[i], sum_w[i], target, mark, weight),
+            by_type={kind: total / count for kind, (count, total) in by_type[i].items()},
+        ))
+    return stats
+
+def format_stats(stats, target=DEFAULT_TARGET, mark=MAX_MARK):
+    """Render the stats as a plain text table for the terminal."""
+    width = max([len("Предмет")] + [len(s.subject) for s in stats])
+    lines = [f"{'Предмет':<{width}} {'оценок':>6} {'средняя':>8} {'взвеш.':>7} {'тренд/мес':>10}  до {target:g}"]
+    for s in stats:
+        if s.needed is None:
+            needed = "недостижимо"
+        elif s.needed == 0:
+            needed = "есть"
+        else:
+            needed = f"{s.needed} × {mark}"
+        lines.append(
+            f"{s.subject:<{width}} {s.marks:>6} {s.average:>8.2f} {s.weighted_average:>7.2f} "
+            f"{s.trend:>+10.2f}  {needed}"
+        )
+    return "\n".join(lines)
+
+async def collect(sessions, start, end, offline, concurrency, weights=None, parser=None):
+    """Load the grade reports of every session into one table.
+
+    With more than one account, subjects are labelled with the account.
+    """
+    from grades import DEFAULT_PARSER
+    from reports import load_grades
+
+    table = GradeTable(weights)
+    loaded = await asyncio.gather(*(
+        load_grades(session, start, end, offline, parser=parser or DEFAULT_PARSER, concurrency=concurrency)
+        for session in sessions
+    ))
+    for session, grades in zip(sessions, loaded):
+        for subject, subject_grades in grades.items():
+            label = f"{session.user_name}: {subject}" if len(sessions) > 1 else subject
+            table.add(label, subject_grades.assignments)
+    return table
+
+async def run(args):
+    from config import load_config
+    from func import MAX_CONCURRENT_REQUESTS, school_year_start
+    from reports import get_report_parser, close_report_parser
+    from session import get_session, close_sessions
+
+    config = load_config()
+    concurrency = config.get("concurrency", MAX_CONCURRENT_REQUESTS)
+    get_report_parser(config.get("parse_workers"))
+    if args.accounts:
+        from batch import load_accounts
+        accounts = load_accounts(args.accounts)
+    else:
+        accounts = [config]
+    sessions = [get_session(a["username"], a["password"], a["school"]) for a in accounts]
+    try:
+        table = await collect(
+            sessions, args.start or school_year_start(), args.end or datetime.date.today(),
+            args.offline, concurrency, config.get("mark_weights"), config.get("report_parser"),
+        )
+    finally:
+        close_report_parser()
+        await close_sessions(logout=not config.get("keep_session", True))
+    stats = analyze(table, args.target, args.mark)
+    if args.json:
+        print(json.dumps([s._asdict() for s in stats], ensure_ascii=False, indent=2))
+    else:
+        print(format_stats(stats, args.target, args.mark))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Averages, trends and the marks needed for a target, per subject")
+    parser.add_argument("--target", type=float, default=DEFAULT_TARGET, help="average to reach (default 4.5)")
+    parser.add_argument("--mark", type=int, default=MAX_MARK, help="mark to reach it with (default 5)")
+    parser.add_argument("--from", dest="start", type=datetime.date.fromisoformat, help="first day, YYYY-MM-DD (default September 1st)")
+    parser.add_argument("--to", dest="end", type=datetime.date.fromisoformat, help="last day, YYYY-MM-DD (default today)")
+    parser.add_argument("--accounts", help="JSON file with several accounts, as for batch.py")
+    parser.add_argument("--offline", action="store_true", help="use only locally stored reports")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        asyncio.run(run(args))
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        sys.exit(1)
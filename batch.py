@@ -0,0 +1,170 @@
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+import time
+import httpx
+from transport import ConditionalTransport, make_transport
+
+# Defaults for a whole shop of accounts on one server
+ACCOUNTS_AT_ONCE = 8
+GLOBAL_RATE = 20
+HOST_RATE = 10
+POOL_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+
+class RateLimiter:
+    """Token bucket: `rate` acquisitions per second on average, bursts up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """Hold requests back to a global and a per-host rate (requests per second, 0 for no limit)."""
+
+    def __init__(self, transport=None, rate=GLOBAL_RATE, host_rate=HOST_RATE):
+        self.transport = transport or ConditionalTransport(make_transport(POOL_LIMITS))
+        self.host_rate = host_rate
+        self._global = RateLimiter(rate) if rate else None
+        self._hosts = {}
+
+    async def handle_async_request(self, request):
+        # Wait for the host first, so no global slot is spent while queued on it
+        if self.host_rate:
+            limiter = self._hosts.get(request.url.host)
+            if limiter is None:
+                limiter = self._hosts[request.url.host] = RateLimiter(self.host_rate)
+            await limiter.acquire()
+        if self._global:
+            await self._global.acquire()
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        # Shared by every account's client; close() really shuts it down
+        pass
+
+    async def close(self):
+        close = getattr(self.transport, "close", None)
+        if asyncio.iscoroutinefunction(close):
+            await close()
+        else:
+            await self.transport.aclose()
+
+def load_accounts(path):
+    """Read a JSON list of {"username", "password", "school"} objects, like config.json."""
+    with open(path, 'r', encoding='utf-8') as f:
+        accounts = json.load(f)
+    if not isinstance(accounts, list):
+        raise ValueError(f"{path}: expected a list of accounts")
+    return accounts
+
+def lesson_row(lesson):
+    return {
+        "number": lesson.number,
+        "subject": lesson.subject,
+        "room": lesson.room,
+        "start": lesson.start.strftime('%H:%M'),
+        "end": lesson.end.strftime('%H:%M'),
+    }
+
+async def run_account(account, transport, args):
+    """Run the homework and tomorrow's schedule pipelines for one account."""
+    from func import main, fetch_diary, is_no_schedule
+    from session import Session
+
+    session = None
+    result = {"account": account.get("username") if isinstance(account, dict) else None}
+    started = time.perf_counter()
+    try:
+        # A malformed entry is reported as this account's error, like any other failure
+        session = Session(account["username"], account["password"], account["school"], transport)
+        result["account"] = session.account
+        result["homework"] = [
+            dict(homework._asdict(), deadline=homework.deadline.isoformat())
+            for homework in await main(session, args.concurrency, args.offline)
+        ]
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        try:
+            diary = await fetch_diary(session, tomorrow, tomorrow, args.offline)
+            result["schedule"] = [lesson_row(lesson) for day in diary.schedule for lesson in day.lessons]
+        except Exception as e:
+            if not is_no_schedule(e):
+                raise
+            result["schedule"] = []
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if session:
+            await session.close(logout=args.logout)
+    result["elapsed"] = round(time.perf_counter() - started, 3)
+    return result
+
+async def run(args, output, transport=None):
+    """Process every account, writing a JSON line as soon as each one finishes.
+
+    All accounts share one connection pool (`transport`, by default a new
+    conditional HTTP/2-capable pool) behind the rate limits. Returns the number of failed
+    accounts.
+    """
+    from func import gather_limited, MAX_CONCURRENT_REQUESTS
+
+    if args.concurrency is None:
+        args.concurrency = MAX_CONCURRENT_REQUESTS
+    accounts = load_accounts(args.accounts)
+    transport = RateLimitedTransport(transport, args.rate, args.host_rate)
+    failed = 0
+
+    async def process(account):
+        nonlocal failed
+        result = await run_account(account, transport, args)
+        failed += "error" in result
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output.flush()
+
+    try:
+        await gather_limited(process, accounts, args.parallel)
+    finally:
+        await transport.close()
+    return failed
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch homework and tomorrow's schedule for many accounts as NDJSON")
+    parser.add_argument("accounts", help='JSON file with a list of {"username", "password", "school"} objects')
+    parser.add_argument("-o", "--output", help="write NDJSON here instead of stdout")
+    parser.add_argument("--parallel", type=int, default=ACCOUNTS_AT_ONCE, help="accounts processed at once")
+    parser.add_argument("--concurrency", type=int, help="assignment requests in flight per account (default 6)")
+    parser.add_argument("--rate", type=float, default=GLOBAL_RATE, help="requests per second over all hosts, 0 for no limit")
+    parser.add_argument("--host-rate", type=float, default=HOST_RATE, help="requests per second to one host, 0 for no limit")
+    parser.add_argument("--offline", action="store_true", help="use only locally cached data")
+    parser.add_argument("--logout", action="store_true", help="end every server session instead of saving its token")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        failed = asyncio.run(run(args, output))
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,191 @@
+import asyncio
+import datetime
+import gzip
+import hashlib
+import json
+import re
+import httpx
+
+# Stand-in for sgo.rso23.ru served through httpx.MockTransport: realistic
+# diary, assignment, school and grade report payloads with tunable sizes
+
+SUBJECTS = [
+    'Алгебра', 'Геометрия', 'Русский язык', 'Литература', 'Физика', 'Химия',
+    'Биология', 'История', 'Обществознание', 'География', 'Английский язык', 'Информатика',
+]
+ASSIGNMENT_TYPES = [
+    {'id': 3, 'name': 'Домашнее задание'},
+    {'id': 1, 'name': 'Ответ на уроке'},
+    {'id': 2, 'name': 'Контрольная работа'},
+]
+
+def _date(value):
+    return value.isoformat() + 'T00:00:00'
+
+def make_diary(start, end, lessons_per_day=6, assignments_per_lesson=1):
+    """Build a student/diary response for start..end.
+
+    Every day has lessons and nothing is due before tomorrow, so results do
+    not depend on the weekday the benchmark runs on.
+    """
+    earliest_due = datetime.date.today() + datetime.timedelta(days=1)
+    days = []
+    day = start
+    while day <= end:
+        lessons = []
+        for number in range(1, lessons_per_day + 1):
+            subject = SUBJECTS[(day.toordinal() + number) % len(SUBJECTS)]
+            assignments = []
+            for k in range(assignments_per_lesson):
+                assignment_id = day.toordinal() * 100 + number * 10 + k
+                assignments.append({
+                    'id': assignment_id,
+                    'typeId': 3 if k == 0 else 1,
+                    'assignmentName': f'{subject}: упражнения {assignment_id % 997}, параграф {number}',
+                    'dueDate': _date(max(day, earliest_due)),
+                    'mark': None,
+                    'markComment': None,
+                })
+            lessons.append({
+                'day': _date(day),
+                'startTime': f'{7 + number:02d}:00',
+                'endTime': f'{7 + number:02d}:45',
+                'room': f'{200 + number}',
+                'number': number,
+                'subjectName': subject,
+                'assignments': assignments,
+            })
+        days.append({'date': _date(day), 'lessons': lessons})
+        day += datetime.timedelta(days=1)
+    return {'weekStart': _date(start), 'weekEnd': _date(end), 'weekDays': days}
+
+def make_assignment(assignment_id):
+    subject = SUBJECTS[assignment_id % len(SUBJECTS)]
+    return {
+        'id': assignment_id,
+        'isDeleted': False,
+        'subjectGroup': {'id': assignment_id % 50, 'name': f'10А/{subject}'},
+        'teachers': [{'id': 1, 'name': 'Иванова Ирина Ивановна'}],
+        'assignmentName': 'упражнения',
+        'description': 'Подробное описание задания ' * 5,
+        'weight': 1,
+        'date': _date(datetime.date.today()),
+    }
+
+def make_schools(count=2000):
+    kinds = ['МБОУ СОШ №', 'МАОУ Гимназия №', 'МБОУ Лицей №', 'МБОУ ООШ №']
+    return [
+        {
+            'id': 1000 + i,
+            'shortName': f'{kinds[i % len(kinds)]} {i + 1}',
+            'name': f'Муниципальное образовательное учреждение № {i + 1}',
+            'addressString': f'г. Краснодар, ул. Школьная, д. {i + 1}',
+        }
+        for i in range(count)
+    ]
+
+def make_report(rows=60, has_terms=False):
+    """Build a grade report page in the shape Grades expects."""
+    spans = [
+        'Отчет об успеваемости', 'Период:', 'с 01.09.25 по 31.12.25', 'Предмет:', 'Алгебра',
+        'Класс:', '10А', 'Учитель:', 'Иванова Ирина Ивановна',
+    ]
+    if has_terms:
+        spans = ['Четверть:', '1'] + spans[:3] + ['-'] + spans[3:] + ['-']
+    header = '<table><tr><td>Ученик</td><td>' + ''.join(f'<span>{text}</span>' for text in spans) + '</td></tr></table>'
+    types = ['Домашнее задание', 'Ответ на уроке', 'Контрольная работа']
+    body = ''.join(
+        f'<tr><td>{types[i % 3]}</td><td>Тема урока <b>{i}</b></td>'
+        f'<td>{i % 28 + 1:02d}.09.25</td><td>{i % 28 + 1:02d}.10.25</td><td>{(i % 4) + 2 if i % 5 else ""}</td></tr>'
+        for i in range(rows)
+    )
+    return (
+        '<html><head><title>Отчет</title></head><body>' + header +
+        '<table class="table-print"><tr><th>Тип</th><th>Тема</th><th>Дата</th><th>Выдано</th><th>Оценка</th></tr>' +
+        body + '<tr class="totals"><td>Итого</td><td></td><td>Средняя оценка: 4,25</td></tr></table></body></html>'
+    )
+
+class MockNetSchool:
+    """Request handler for httpx.MockTransport that also counts traffic."""
+
+    def __init__(self, latency=0.0, lessons_per_day=6, assignments_per_lesson=1,
+                 schools=2000, report_rows=60, etag=False, compress=False):
+        self.latency = latency
+        # Act like a server that sends ETags (and answers 304) or gzips bodies
+        self.etag = etag
+        self.compress = compress
+        self.lessons_per_day = lessons_per_day
+        self.assignments_per_lesson = assignments_per_lesson
+        self.schools = make_schools(schools)
+        self.report_rows = report_rows
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.not_modified = 0
+        self.paths = {}
+
+    async def __call__(self, request):
+        self.requests += 1
+        self.bytes_sent += len(request.content)
+        path = request.url.path
+        key = re.sub(r'/\d+$', '/{id}', path)
+        self.paths[key] = self.paths.get(key, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        status, body, content_type = self.route(request, path)
+        if not isinstance(body, (bytes, str)):
+            body = json.dumps(body, ensure_ascii=False)
+        if isinstance(body, str):
+            body = body.encode()
+        headers = {'content-type': content_type}
+        if self.etag and request.method == 'GET' and status == 200:
+            headers['etag'] = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if request.headers.get('if-none-match') == headers['etag']:
+                self.not_modified += 1
+                return httpx.Response(304, headers={'etag': headers['etag']})
+        if self.compress and 'gzip' in request.headers.get('accept-encoding', ''):
+            body = gzip.compress(body)
+            headers['content-encoding'] = 'gzip'
+        self.bytes_received += len(body)
+        # Served as a stream, like a real connection: still encoded when it reaches the transports
+        return httpx.Response(status, headers=headers, stream=httpx.ByteStream(body))
+
+    def route(self, request, path):
+        js = 'application/json'
+        if path.endswith('/logindata'):
+            return 200, {'version': '5.0'}, js
+        if path.endswith('/auth/getdata'):
+            return 200, {'lt': '1', 'ver': '1', 'salt': '12345'}, js
+        if path.endswith('/login'):
+            return 200, {'at': 'mock-token'}, js
+        if path.endswith('/auth/logout'):
+            return 200, {}, js
+        if path.endswith('/student/diary/init'):
+            return 200, {'students': [{'studentId': 1}], 'currentStudentId': 0}, js
+        if path.endswith('/years/current'):
+            return 200, {'id': 1}, js
+        if path.endswith('/grade/assignment/types'):
+            return 200, ASSIGNMENT_TYPES, js
+        if path.endswith('/student/diary'):
+            start = datetime.date.fromisoformat(request.url.params['weekStart'])
+            end = datetime.date.fromisoformat(request.url.params['weekEnd'])
+            return 200, make_diary(start, end, self.lessons_per_day, self.assignments_per_lesson), js
+        match = re.search(r'/student/diary/assigns/(\d+)$', path)
+        if match:
+            return 200, make_assignment(int(match.group(1))), js
+        if path.endswith('/schools/search'):
+            name = request.url.params.get('name', '').lower()
+            return 200, [school for school in self.schools if name in school['shortName'].lower()], js
+        if path.endswith('/reports/studentgrades/initfilters'):
+            items = [{'value': str(i), 'title': subject} for i, subject in enumerate(SUBJECTS)]
+            return 200, [{'filterId': 'SGID', 'items': items}], js
+        if path.endswith('ReportStudentGrades.asp'):
+            return 200, make_report(self.report_rows), 'text/html; charset=utf-8'
+        return 404, {'message': f'unknown path {path}'}, js
+
+    def transport(self):
+        return httpx.MockTransport(self)
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Keep the benchmark away from the real config directory: the project modules
+# resolve it from these variables when they are imported
+WORKDIR = tempfile.mkdtemp(prefix="netschool-bench-")
+os.environ["HOME"] = WORKDIR
+os.environ["APPDATA"] = WORKDIR
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics
+import cache
+import cassette
+import func
+import grades
+import reports
+import schools
+import session
+import transport
+from mock_server import MockNetSchool, make_report
+
+class CassetteServer:
+    """Counts traffic like MockNetSchool, but replays a recorded cassette."""
+
+    def __init__(self, path, speed):
+        self.path = path
+        self.speed = speed
+        self.reset()
+
+    def reset(self):
+        self._transports = []
+        self.bytes_sent = 0
+        self.paths = {}
+
+    @property
+    def requests(self):
+        return sum(t.requests for t in self._transports)
+
+    @property
+    def bytes_received(self):
+        return sum(t.bytes_received for t in self._transports)
+
+    def transport(self):
+        transport = cassette.ReplayTransport(self.path, self.speed)
+        self._transports.append(transport)
+        return transport
+
+class Bench:
+    """Runs scenarios against a MockNetSchool with fresh local state."""
+
+    def __init__(self, server, args):
+        self.server = server
+        self.args = args
+        self.runs = 0
+        self.report_parsers = {}
+
+    def fresh_state(self):
+        """Point every on-disk store at an empty directory."""
+        self.runs += 1
+        state_dir = os.path.join(WORKDIR, f"run{self.runs}")
+        os.makedirs(state_dir)
+        cache._cache = cache.Cache(os.path.join(state_dir, "cache.sqlite3"))
+        session.SESSION_FILE = os.path.join(state_dir, "session.json")
+        schools.SCHOOLS_FILE = os.path.join(state_dir, "schools.json")
+        schools._index = None
+        schools._next_refresh = 0
+        func._school_searches.clear()
+
+    def transport(self):
+        # Like the app: every request goes through the conditional transport
+        return transport.ConditionalTransport(self.server.transport())
+
+    def session(self):
+        return session.Session("bench", "secret", 1, transport=self.transport())
+
+    def report_parser(self, processes):
+        # Kept between runs, like the app's pool: worker start-up is not measured
+        if processes not in self.report_parsers:
+            self.report_parsers[processes] = reports.ReportParser(processes=processes)
+        return self.report_parsers[processes]
+
+    def close(self):
+        for report_parser in self.report_parsers.values():
+            report_parser.close()
+        reports.close_report_parser()
+
+async def login(bench):
+    s = bench.session()
+    await s.get_api()
+    await s.close()
+
+async def homework_all(bench):
+    s = bench.session()
+    await func.main(s, bench.args.concurrency)
+    await s.close()
+
+async def homework_all_expired(bench):
+    """Sync the week, then let its cached diary expire: the next run is a delta sync."""
+    await homework_all(bench)
+    with cache.get_cache().db as db:
+        db.execute("UPDATE diary SET expires_at = 0")
+
+async def homework_tomorrow(bench):
+    s = bench.session()
+    await func.get_tomorrow_assignments(s, bench.args.concurrency)
+    await s.close()
+
+async def homework_term(bench):
+    s = bench.session()
+    start = datetime.date.today()
+    await func.sync_homework_range(s, start, start + datetime.timedelta(weeks=12), bench.args.concurrency)
+    await s.close()
+
+async def diary_term(bench):
+    s = bench.session()
+    start = datetime.date.today()
+    await func.fetch_diary_range(s, start, start + datetime.timedelta(weeks=12))
+    await s.close()
+
+async def grade_reports(bench):
+    s = bench.session()
+    start, end = datetime.date(2025, 9, 1), datetime.date(2025, 12, 31)
+    await reports.fetch_grades(s, range(bench.args.reports), start, end, concurrency=bench.args.concurrency)
+    await s.close()
+
+async def school_index(bench):
+    index = await schools.get_school_index(transport=bench.transport())
+    for query in ("сош 15", "гимназия 7", "лицей", "ООШ 120"):
+        index.search(query)
+
+async def school_search(bench):
+    for query in ("сош", "сош 1", "сош 15", "гимназия"):
+        await func.search_schools(query, bench.transport())
+
+def parse_reports(parser):
+    async def run(bench):
+        html = make_report(bench.args.report_rows)
+        for _ in range(bench.args.reports):
+            grades.Grades(html, [], parser=parser).to_dict()
+    return run
+
+def parse_reports_pool(processes):
+    async def run(bench):
+        html = make_report(bench.args.report_rows)
+        await bench.report_parser(processes).parse_many([html] * bench.args.reports, [])
+    return run
+
+async def homework_search(bench):
+    s = bench.session()
+    for query in ("упражн", "параграф 1", "биология", "нет такого"):
+        func.search_homework(s, query)
+    await s.close()
+
+async def grade_analytics(bench):
+    # A school year of every subject for 20 accounts, from one parsed report
+    assignments = grades.Grades(make_report(bench.args.report_rows), []).assignments
+    table = analytics.GradeTable()
+    for account in range(20):
+        for subject in range(bench.args.reports):
+            table.add(f"{account}: {subject}", assignments * 4)
+    analytics.analyze(table)
+
+# name -> (setup run beforehand and not measured, measured scenario)
+SCENARIOS = {
+    "login-cold": (None, login),
+    "login-warm": (login, login),
+    "all-cold": (None, homework_all),
+    "all-warm": (homework_all, homework_all),
+    "all-resync": (homework_all_expired, homework_all),
+    "tomorrow-cold": (None, homework_tomorrow),
+    "tomorrow-warm": (homework_tomorrow, homework_tomorrow),
+    "term-cold": (None, homework_term),
+    "term-warm": (homework_term, homework_term),
+    "search": (homework_term, homework_search),
+    "diary-term": (None, diary_term),
+    "reports-cold": (None, grade_reports),
+    "reports-warm": (grade_reports, grade_reports),
+    "schools-index": (None, school_index),
+    "schools-search": (None, school_search),
+    "parse-html.parser": (None, parse_reports("html.parser")),
+    "parse-stream": (None, parse_reports("stream")),
+    "parse-threads": (parse_reports_pool(False), parse_reports_pool(False)),
+    "parse-processes": (parse_reports_pool(True), parse_reports_pool(True)),
+    "analytics": (None, grade_analytics),
+}
+
+async def measure(bench, setup, scenario, trace_memory):
+    bench.fresh_state()
+    if setup:
+        await setup(bench)
+    bench.server.reset()
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await scenario(bench)
+    wall = time.perf_counter() - started
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return wall, peak
+
+async def run_all(args):
+    if args.replay:
+        server = CassetteServer(args.replay, args.replay_speed)
+    else:
+        server = MockNetSchool(
+            latency=args.latency / 1000,
+            lessons_per_day=args.lessons,
+            assignments_per_lesson=args.assignments,
+            schools=args.schools,
+            report_rows=args.report_rows,
+            etag=args.etag,
+            compress=args.gzip,
+        )
+    bench = Bench(server, args)
+    results = []
+    try:
+        for name, (setup, scenario) in SCENARIOS.items():
+            if args.only and not any(pattern in name for pattern in args.only):
+                continue
+            # Best wall time of untraced runs; memory and traffic from a traced one
+            walls = [(await measure(bench, setup, scenario, False))[0] for _ in range(args.repeat)]
+            _, peak = await measure(bench, setup, scenario, True)
+            results.append({
+                "scenario": name,
+                "wall_ms": round(min(walls) * 1000, 2),
+                "requests": server.requests,
+                "bytes_sent": server.bytes_sent,
+                "bytes_received": server.bytes_received,
+                "peak_memory_kb": round(peak / 1024, 1),
+                "paths": dict(server.paths),
+            })
+    finally:
+        bench.close()
+    return results
+
+def print_table(results):
+    print(f"{'scenario':<20} {'wall ms':>10} {'requests':>9} {'kB in':>9} {'kB out':>8} {'peak kB':>9}")
+    for r in results:
+        print(
+            f"{r['scenario']:<20} {r['wall_ms']:>10.2f} {r['requests']:>9} "
+            f"{r['bytes_received'] / 1024:>9.1f} {r['bytes_sent'] / 1024:>8.1f} {r['peak_memory_kb']:>9.1f}"
+        )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the fetch pipeline and parsers against a mock NetSchool")
+    parser.add_argument("--latency", type=float, default=30, help="injected latency per request, ms")
+    parser.add_argument("--lessons", type=int, default=6, help="lessons per day in the diary")
+    parser.add_argument("--assignments", type=int, default=1, help="assignments per lesson")
+    parser.add_argument("--schools", type=int, default=2000, help="schools in the directory")
+    parser.add_argument("--reports", type=int, default=12, help="grade reports (subjects) to fetch or parse")
+    parser.add_argument("--report-rows", type=int, default=60, help="assignment rows per grade report")
+    parser.add_argument("--concurrency", type=int, default=func.MAX_CONCURRENT_REQUESTS)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per scenario, the best is reported")
+    parser.add_argument("--only", nargs="*", help="run only scenarios whose name contains one of these")
+    parser.add_argument("--etag", action="store_true", help="mock server sends ETags and answers 304")
+    parser.add_argument("--gzip", action="store_true", help="mock server gzips responses")
+    parser.add_argument("--replay", metavar="CASSETTE", help="serve a cassette recorded with gui.py --record instead of the mock")
+    parser.add_argument("--replay-speed", type=float, default=0, help="scale recorded response times, 0 for no delay")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(run_all(args))
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_table(results)
@@ -0,0 +1,352 @@
+import json
+import os
+import re
+import sqlite3
+import time
+import datetime
+from config import get_config_dir
+
+CACHE_FILE = os.path.join(get_config_dir(), "cache.sqlite3")
+
+# Past weeks almost never change, the current and upcoming ones do
+PAST_WEEK_TTL = 30 * 24 * 60 * 60
+CURRENT_WEEK_TTL = 10 * 60
+
+# Assignment id -> subject group memo: an assignment's subject never changes,
+# only whether it was deleted does, and only while it is still open
+MAX_SUBJECT_GROUPS = 5000
+SUBJECT_GROUP_REVALIDATE = 6 * 60 * 60
+
+# Conditional-request bodies (ETag / Last-Modified), least recently used evicted
+MAX_HTTP_ENTRIES = 2000
+
+# A past week whose homework changed this recently is still checked on sync
+RECENT_CHANGE_WINDOW = 14 * 24 * 60 * 60
+
+# Full-text index over homework_history. Prefix queries stand in for Russian
+# word forms ("сочинен" finds "сочинение" and "сочинения"); the subject counts
+# for more than the text, the comment for less
+HOMEWORK_INDEX = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS homework_fts USING fts5(
+        lesson, content, comment,
+        content='homework_history', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+    CREATE TRIGGER IF NOT EXISTS homework_history_insert AFTER INSERT ON homework_history BEGIN
+        INSERT INTO homework_fts (rowid, lesson, content, comment)
+        VALUES (new.rowid, new.lesson, new.content, new.comment);
+    END;
+    CREATE TRIGGER IF NOT EXISTS homework_history_delete AFTER DELETE ON homework_history BEGIN
+        INSERT INTO homework_fts (homework_fts, rowid, lesson, content, comment)
+        VALUES ('delete', old.rowid, old.lesson, old.content, old.comment);
+    END;
+    CREATE TRIGGER IF NOT EXISTS homework_history_update AFTER UPDATE ON homework_history BEGIN
+        INSERT INTO homework_fts (homework_fts, rowid, lesson, content, comment)
+        VALUES ('delete', old.rowid, old.lesson, old.content, old.comment);
+        INSERT INTO homework_fts (rowid, lesson, content, comment)
+        VALUES (new.rowid, new.lesson, new.content, new.comment);
+    END;
+"""
+SEARCH_WEIGHTS = (2.0, 1.0, 0.5)
+
+class OfflineCacheMiss(Exception):
+    """Raised in offline mode when the requested data was never cached."""
+
+def diary_ttl(end, today=None):
+    """Return how long (in seconds) a diary ending on `end` stays fresh."""
+    today = today or datetime.date.today()
+    monday = today - datetime.timedelta(days=today.weekday())
+    return PAST_WEEK_TTL if end < monday else CURRENT_WEEK_TTL
+
+def week_may_change(end, changed_at, today=None):
+    """Tell whether homework of a range ending on `end` is worth syncing again."""
+    today = today or datetime.date.today()
+    monday = today - datetime.timedelta(days=today.weekday())
+    return end >= monday or changed_at > time.time() - RECENT_CHANGE_WINDOW
+
+class Cache:
+    """SQLite store for API responses, kept in the config directory."""
+
+    def __init__(self, path=CACHE_FILE):
+        # Diaries and reports are personal; keep the file readable by the owner only
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+        os.chmod(path, 0o600)
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS diary (
+                account TEXT NOT NULL,
+                week_start TEXT NOT NULL,
+                week_end TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (account, week_start, week_end)
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                account TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (account, key)
+            );
+            CREATE TABLE IF NOT EXISTS subject_groups (
+                id INTEGER PRIMARY KEY,
+                name TEXT,
+                is_deleted INTEGER NOT NULL,
+                checked_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS subject_groups_used_at ON subject_groups (used_at);
+            CREATE TABLE IF NOT EXISTS reports (
+                account TEXT NOT NULL,
+                subject_id TEXT NOT NULL,
+                has_terms INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                html TEXT NOT NULL,
+                parsed TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (account, subject_id, has_terms)
+            );
+            CREATE TABLE IF NOT EXISTS homework (
+                account TEXT NOT NULL,
+                week_start TEXT NOT NULL,
+                week_end TEXT NOT NULL,
+                rows TEXT NOT NULL,
+                synced_at REAL NOT NULL,
+                changed_at REAL NOT NULL,
+                PRIMARY KEY (account, week_start, week_end)
+            );
+            CREATE TABLE IF NOT EXISTS http (
+                key TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                used_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS http_used_at ON http (used_at);
+            CREATE TABLE IF NOT EXISTS homework_history (
+                account TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                lesson TEXT NOT NULL,
+                is_duty INTEGER NOT NULL,
+                deadline INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                comment TEXT,
+                PRIMARY KEY (account, id)
+            );
+        """)
+        try:
+            self.db.executescript(HOMEWORK_INDEX)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search scans the history, unranked
+            self.fts = False
+        # Start the history with the homework synced before it existed
+        if self.db.execute("SELECT NOT EXISTS (SELECT 1 FROM homework_history)").fetchone()[0]:
+            for account, rows in self.db.execute("SELECT account, rows FROM homework").fetchall():
+                self.index_homework(account, json.loads(rows))
+
+    def get_diary(self, account, start, end, allow_stale=False, max_age=None):
+        """Return the cached raw diary JSON, or None if missing or expired.
+
+        `max_age` (seconds) additionally rejects entries fetched longer ago.
+        """
+        row = self.db.execute(
+            "SELECT payload, fetched_at, expires_at FROM diary WHERE account = ? AND week_start = ? AND week_end = ?",
+            (account, start.isoformat(), end.isoformat()),
+        ).fetchone()
+        if row is None:
+            return None
+        payload, fetched_at, expires_at = row
+        if not allow_stale:
+            now = time.time()
+            if expires_at < now or (max_age is not None and fetched_at < now - max_age):
+                return None
+        return json.loads(payload)
+
+    def put_diary(self, account, start, end, payload):
+        """Store a raw diary JSON response."""
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO diary VALUES (?, ?, ?, ?, ?, ?)",
+                (account, start.isoformat(), end.isoformat(), json.dumps(payload),
+                 now, now + diary_ttl(end)),
+            )
+
+    def get_meta(self, account, key, default=None):
+        row = self.db.execute(
+            "SELECT value FROM meta WHERE account = ? AND key = ?", (account, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def put_meta(self, account, key, value):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?, ?)", (account, key, json.dumps(value))
+            )
+
+    def get_subject_groups(self, ids):
+        """Return {id: (name, is_deleted, checked_at)} for the memoized ids."""
+        found = {}
+        ids = list(ids)
+        # Stay well below SQLite's limit on bound parameters
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = self.db.execute(
+                f"SELECT id, name, is_deleted, checked_at FROM subject_groups WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for id, name, is_deleted, checked_at in rows:
+                found[id] = (name, bool(is_deleted), checked_at)
+        if found:
+            now = time.time()
+            with self.db:
+                self.db.executemany(
+                    "UPDATE subject_groups SET used_at = ? WHERE id = ?", [(now, id) for id in found]
+                )
+        return found
+
+    def put_subject_groups(self, entries):
+        """Memoize (id, name, is_deleted) entries, evicting the least recently used."""
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO subject_groups VALUES (?, ?, ?, ?, ?)",
+                [(id, name, int(is_deleted), now, now) for id, name, is_deleted in entries],
+            )
+            self.db.execute(
+                "DELETE FROM subject_groups WHERE id IN "
+                "(SELECT id FROM subject_groups ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (MAX_SUBJECT_GROUPS,),
+            )
+
+    def get_report(self, account, subject_id, has_terms, digest):
+        """Return the parsed report stored under this content hash, if any."""
+        row = self.db.execute(
+            "SELECT html, parsed FROM reports WHERE account = ? AND subject_id = ? AND has_terms = ? AND hash = ?",
+            (account, str(subject_id), int(has_terms), digest),
+        ).fetchone()
+        if row is None:
+            return None
+        html, parsed = row
+        parsed = json.loads(parsed)
+        parsed['raw'] = html
+        return parsed
+
+    def put_report(self, account, subject_id, has_terms, digest, html, parsed):
+        """Store a report's raw HTML, its content hash and the parse result."""
+        parsed = {key: value for key, value in parsed.items() if key != 'raw'}
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (account, str(subject_id), int(has_terms), digest, html, json.dumps(parsed), time.time()),
+            )
+
+    def get_reports(self, account, has_terms):
+        """Return {subject_id: parse result} of every report stored for the account."""
+        rows = self.db.execute(
+            "SELECT subject_id, html, parsed FROM reports WHERE account = ? AND has_terms = ?",
+            (account, int(has_terms)),
+        ).fetchall()
+        reports = {}
+        for subject_id, html, parsed in rows:
+            reports[subject_id] = json.loads(parsed)
+            reports[subject_id]['raw'] = html
+        return reports
+
+    def get_homework(self, account, start, end):
+        """Return (rows, synced_at, changed_at) of the homework snapshot for start..end, or None."""
+        row = self.db.execute(
+            "SELECT rows, synced_at, changed_at FROM homework WHERE account = ? AND week_start = ? AND week_end = ?",
+            (account, start.isoformat(), end.isoformat()),
+        ).fetchone()
+        if row is None:
+            return None
+        rows, synced_at, changed_at = row
+        return json.loads(rows), synced_at, changed_at
+
+    def put_homework(self, account, start, end, rows, changed_at):
+        """Store the homework snapshot (Homework.to_row rows) for start..end."""
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO homework VALUES (?, ?, ?, ?, ?, ?)",
+                (account, start.isoformat(), end.isoformat(), json.dumps(rows, ensure_ascii=False),
+                 time.time(), changed_at),
+            )
+
+    def index_homework(self, account, rows):
+        """Add homework (Homework.to_row rows) to the searchable history, updating changed ones."""
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO homework_history VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (account, id) DO UPDATE SET lesson = excluded.lesson, is_duty = excluded.is_duty, "
+                "deadline = excluded.deadline, content = excluded.content, comment = excluded.comment "
+                # Unchanged rows are not rewritten, which would churn the index
+                "WHERE (lesson, is_duty, deadline, content, comment) IS NOT "
+                "(excluded.lesson, excluded.is_duty, excluded.deadline, excluded.content, excluded.comment)",
+                [(account, *row) for row in rows],
+            )
+
+    def search_homework(self, account, query, start=None, end=None, limit=50):
+        """Return history rows matching every word of `query`, best matches first.
+
+        `start` and `end` limit the deadlines. Words match as prefixes.
+        """
+        words = re.findall(r'\w+', query)
+        if not words:
+            return []
+        low = start.toordinal() if start else 0
+        high = end.toordinal() if end else datetime.date.max.toordinal()
+        if not self.fts:
+            rows = self.db.execute(
+                "SELECT id, lesson, is_duty, deadline, content, comment FROM homework_history "
+                "WHERE account = ? AND deadline BETWEEN ? AND ? ORDER BY deadline DESC",
+                (account, low, high),
+            ).fetchall()
+            words = [word.casefold() for word in words]
+            return [
+                row for row in rows
+                if all(word in f"{row[1]} {row[4]} {row[5] or ''}".casefold() for word in words)
+            ][:limit]
+        return self.db.execute(
+            "SELECT h.id, h.lesson, h.is_duty, h.deadline, h.content, h.comment "
+            "FROM homework_fts JOIN homework_history h ON h.rowid = homework_fts.rowid "
+            "WHERE homework_fts MATCH ? AND h.account = ? AND h.deadline BETWEEN ? AND ? "
+            "ORDER BY bm25(homework_fts, ?, ?, ?) LIMIT ?",
+            (" ".join(f'"{word}"*' for word in words), account, low, high, *SEARCH_WEIGHTS, limit),
+        ).fetchall()
+
+    def get_http(self, key):
+        """Return (etag, last_modified, headers, body) of a stored response, or None."""
+        row = self.db.execute(
+            "SELECT etag, last_modified, headers, body FROM http WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        with self.db:
+            self.db.execute("UPDATE http SET used_at = ? WHERE key = ?", (time.time(), key))
+        etag, last_modified, headers, body = row
+        return etag, last_modified, json.loads(headers), body
+
+    def put_http(self, key, etag, last_modified, headers, body):
+        """Store a response body with its validators, evicting the least recently used."""
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO http VALUES (?, ?, ?, ?, ?, ?)",
+                (key, etag, last_modified, json.dumps(headers), body, time.time()),
+            )
+            self.db.execute(
+                "DELETE FROM http WHERE key IN "
+                "(SELECT key FROM http ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (MAX_HTTP_ENTRIES,),
+            )
+
+_cache = None
+
+def get_cache():
+    """Return the process-wide cache, opening it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = Cache()
+    return _cache
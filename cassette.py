@@ -0,0 +1,209 @@
+import asyncio
+import base64
+import gzip
+import json
+import os
+import time
+import zlib
+from collections import defaultdict, deque
+from urllib.parse import parse_qsl, urlencode
+import httpx
+
+# Cassettes are JSON lines, one request/response pair per line, appended as
+# the session goes. Credentials and tokens are replaced before writing.
+SCRUBBED = "***"
+SECRET_FIELDS = {"un", "pw", "pw2", "at", "AT", "password", "login"}
+SECRET_HEADERS = {"at", "authorization", "cookie", "set-cookie"}
+
+def scrub_form(text):
+    return urlencode([(k, SCRUBBED if k in SECRET_FIELDS else v) for k, v in parse_qsl(text, keep_blank_values=True)])
+
+def scrub_json(value):
+    if isinstance(value, dict):
+        return {k: SCRUBBED if k in SECRET_FIELDS else scrub_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [scrub_json(v) for v in value]
+    return value
+
+def scrub_body(content, content_type):
+    """Return the body as text with secrets replaced."""
+    text = content.decode('utf-8', errors='replace')
+    if 'json' in content_type:
+        try:
+            return json.dumps(scrub_json(json.loads(text)), ensure_ascii=False)
+        except ValueError:
+            return text
+    if 'x-www-form-urlencoded' in content_type:
+        return scrub_form(text)
+    return text
+
+def scrub_headers(headers):
+    scrubbed = []
+    for name, value in headers.multi_items():
+        if name.lower() in SECRET_HEADERS:
+            if name.lower() == 'set-cookie':
+                # Keep the cookie name and attributes, drop the value
+                cookie_name, _, rest = value.partition('=')
+                attributes = rest.partition(';')[2]
+                value = f"{cookie_name}={SCRUBBED};{attributes}" if attributes else f"{cookie_name}={SCRUBBED}"
+            else:
+                value = SCRUBBED
+        scrubbed.append([name, value])
+    return scrubbed
+
+def scrub_url(url):
+    query = urlencode([
+        (k, SCRUBBED if k in SECRET_FIELDS else v) for k, v in parse_qsl(url.query.decode(), keep_blank_values=True)
+    ])
+    return str(url.copy_with(query=query.encode() or None))
+
+def decode_content(content, encoding):
+    """Undo Content-Encoding, or return None if it is not supported."""
+    if encoding in ('', 'identity'):
+        return content
+    if encoding == 'gzip':
+        return gzip.decompress(content)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    return None
+
+async def read_raw(response):
+    """Read a transport response; return (content, headers) as sent over the wire.
+
+    The body stays Content-Encoded, since the client decodes the response
+    it is handed. A response that was already read (MockTransport builds
+    them so) is decoded already and loses its Content-Encoding instead.
+    """
+    if response.is_stream_consumed:
+        headers = httpx.Headers(response.headers)
+        for name in ('content-encoding', 'content-length'):
+            if name in headers:
+                del headers[name]
+        return response.content, headers
+    try:
+        content = b"".join([chunk async for chunk in response.aiter_raw()])
+    finally:
+        await response.aclose()
+    return content, response.headers
+
+def use_scratch_state(directory):
+    """Keep the cache, session token and school directory in `directory`.
+
+    Replayed responses are not the user's current data (and their tokens
+    are scrubbed), and a recording should see every request instead of
+    cache hits, so neither may touch the real files in the config directory.
+    """
+    import cache
+    import schools
+    import session
+
+    cache._cache = cache.Cache(os.path.join(directory, "cache.sqlite3"))
+    session.SESSION_FILE = os.path.join(directory, "session.json")
+    schools.SCHOOLS_FILE = os.path.join(directory, "schools.json")
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Pass requests through and append every exchange to a cassette file."""
+
+    def __init__(self, path, transport=None):
+        self.path = path
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        await request.aread()
+        response = await self.transport.handle_async_request(request)
+        content, response_headers = await read_raw(response)
+        elapsed = time.perf_counter() - started
+
+        headers = httpx.Headers(response_headers)
+        body = decode_content(content, headers.get('content-encoding', ''))
+        if body is None:
+            entry_body = {"base64": base64.b64encode(content).decode()}
+        else:
+            # Stored decoded, so the replayed response must not claim an encoding
+            for name in ('content-encoding', 'content-length'):
+                if name in headers:
+                    del headers[name]
+            entry_body = {"text": scrub_body(body, headers.get('content-type', ''))}
+
+        entry = {
+            "time": time.time(),
+            "elapsed": elapsed,
+            "method": request.method,
+            "url": scrub_url(request.url),
+            "request_body": scrub_body(request.content, request.headers.get('content-type', '')),
+            "status": response.status_code,
+            "headers": scrub_headers(headers),
+            "body": entry_body,
+        }
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+        return httpx.Response(
+            response.status_code,
+            headers=response_headers,
+            # A stream, so the body is not decoded here but by the client
+            stream=httpx.ByteStream(content),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        # Clients close their transport when they are closed, but this one
+        # is shared by the whole session; close() really shuts it down
+        self._file.flush()
+
+    async def close(self):
+        self._file.close()
+        await self.transport.aclose()
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Serve responses from a cassette instead of the network.
+
+    Requests are matched by method and (scrubbed) URL, in recorded order; once
+    the recorded responses for a request run out, the last one is repeated.
+    A request whose URL was never recorded (say, a diary for another week)
+    falls back to the recordings of the same path.
+    `speed` scales the recorded response times: 1 replays them as recorded,
+    0 answers immediately.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.speed = speed
+        self.requests = 0
+        self.bytes_received = 0
+        self._entries = defaultdict(deque)
+        self._by_path = {}
+        self._last = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[(entry["method"], entry["url"])].append(entry)
+                    self._by_path[(entry["method"], httpx.URL(entry["url"]).path)] = entry
+
+    async def handle_async_request(self, request):
+        key = (request.method, scrub_url(request.url))
+        queue = self._entries.get(key)
+        if queue:
+            entry = self._last[key] = queue.popleft()
+        elif key in self._last:
+            entry = self._last[key]
+        elif (request.method, request.url.path) in self._by_path:
+            entry = self._by_path[(request.method, request.url.path)]
+        else:
+            return httpx.Response(599, json={"message": f"not in cassette: {key[0]} {key[1]}"})
+
+        if self.speed:
+            await asyncio.sleep(entry["elapsed"] * self.speed)
+        body = entry["body"]
+        content = base64.b64decode(body["base64"]) if "base64" in body else body["text"].encode('utf-8')
+        self.requests += 1
+        self.bytes_received += len(content)
+        return httpx.Response(entry["status"], headers=entry["headers"], content=content)
+
+    async def close(self):
+        pass
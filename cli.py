@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+
+def format_text(homeworks):
+    from records import format_deadline
+
+    lines = []
+    for homework in homeworks:
+        duty = " (задолженность)" if homework.is_duty else ""
+        lines.append(f"{homework.lesson} — {format_deadline(homework.deadline)}{duty}: {homework.content}")
+        if homework.comment:
+            lines.append(f"    {homework.comment}")
+    return "\n".join(lines)
+
+def format_json(homeworks):
+    return json.dumps(
+        [dict(homework._asdict(), deadline=homework.deadline.isoformat()) for homework in homeworks],
+        ensure_ascii=False,
+    )
+
+def format_schedule_text(diary):
+    lines = []
+    for day in diary.schedule:
+        if not day.lessons:
+            continue
+        lines.append(day.day.strftime('%d.%m.%Y'))
+        for lesson in day.lessons:
+            room = f" (каб. {lesson.room})" if lesson.room else ""
+            lines.append(f"  {lesson.number}. {lesson.start:%H:%M}–{lesson.end:%H:%M} {lesson.subject}{room}")
+    return "\n".join(lines)
+
+def format_schedule_json(diary):
+    return json.dumps(
+        [
+            {
+                "date": day.day.isoformat(),
+                "lessons": [
+                    {
+                        "number": lesson.number,
+                        "start": lesson.start.strftime('%H:%M'),
+                        "end": lesson.end.strftime('%H:%M'),
+                        "subject": lesson.subject,
+                        "room": lesson.room,
+                    }
+                    for lesson in day.lessons
+                ],
+            }
+            for day in diary.schedule
+        ],
+        ensure_ascii=False,
+    )
+
+async def run(args):
+    # Imported here so --help stays instant; Textual is never imported
+    from config import load_config
+    from func import (get_tomorrow_assignments, main, sync_homework_range, fetch_diary_range, search_homework,
+                      MAX_CONCURRENT_REQUESTS, SEARCH_LIMIT)
+    from session import get_session, close_sessions
+
+    config = load_config()
+    session = get_session(config["username"], config["password"], config["school"])
+    concurrency = config.get("concurrency", MAX_CONCURRENT_REQUESTS)
+    try:
+        if args.schedule:
+            start = args.start or datetime.date.today() + datetime.timedelta(days=1)
+            return await fetch_diary_range(session, start, args.end or start, args.offline)
+        if args.search is not None:
+            homeworks = search_homework(session, args.search, args.start, args.end, args.limit or SEARCH_LIMIT)
+        elif args.start:
+            homeworks, _ = await sync_homework_range(
+                session, args.start, args.end or args.start, concurrency, args.offline
+            )
+        elif args.all:
+            homeworks = await main(session, concurrency, args.offline)
+        else:
+            homeworks = await get_tomorrow_assignments(session, concurrency, args.offline)
+    finally:
+        await close_sessions(logout=not config.get("keep_session", True))
+    return homeworks or []
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Print NetSchool homework without the interactive UI")
+    view = parser.add_mutually_exclusive_group()
+    view.add_argument("--tomorrow", action="store_true", help="homework due tomorrow (default)")
+    view.add_argument("--all", action="store_true", help="all open homework of the current week")
+    view.add_argument("--from", dest="start", type=datetime.date.fromisoformat, metavar="YYYY-MM-DD",
+                      help="open homework of lessons from this date on (up to a whole term)")
+    parser.add_argument("--to", dest="end", type=datetime.date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="last day of the --from range (default: the same day)")
+    parser.add_argument("--search", metavar="QUERY",
+                        help="search all homework synced so far, best matches first; --from/--to limit the deadlines")
+    parser.add_argument("--schedule", action="store_true",
+                        help="print the lessons of --from..--to (default: tomorrow) instead of homework")
+    parser.add_argument("--limit", type=int, help="matches printed by --search (default 50)")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of plain text")
+    parser.add_argument("--offline", action="store_true", help="use only locally cached data")
+    args = parser.parse_args(argv)
+    if args.search is not None and (args.all or args.tomorrow):
+        parser.error("--search cannot be combined with --all or --tomorrow")
+    if args.schedule and (args.search is not None or args.all or args.tomorrow):
+        parser.error("--schedule cannot be combined with --search, --all or --tomorrow")
+    if args.end and not args.start and args.search is None:
+        parser.error("--to needs --from")
+    if args.start and args.end and args.end < args.start:
+        parser.error("--to is before --from")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        result = asyncio.run(run(args))
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.schedule:
+        output = format_schedule_json(result) if args.json else format_schedule_text(result)
+    else:
+        output = format_json(result) if args.json else format_text(result)
+    if output:
+        print(output)
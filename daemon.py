@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import datetime
+import random
+import sys
+
+# Refresh about every half an hour; the jitter spreads clients over time, so
+# they do not all hit the server at the same moment
+REFRESH_INTERVAL = 30 * 60
+JITTER = 0.2
+
+def next_delay(interval=REFRESH_INTERVAL, jitter=JITTER):
+    """Return the seconds to wait before the next refresh: interval ± jitter."""
+    return interval * (1 + random.uniform(-jitter, jitter))
+
+async def refresh(session, concurrency, grades=True, parser=None):
+    """Bring the local store up to date: this week's homework, tomorrow's
+    diary and, optionally, this school year's grade reports."""
+    from func import sync_homework, fetch_diary, current_week, is_no_schedule, school_year_start
+    from grades import DEFAULT_PARSER
+    from reports import load_grades
+    from tracing import tracer
+
+    with tracer.span("refresh", "daemon"):
+        start, end = current_week()
+        await sync_homework(session, start, end, concurrency)
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        try:
+            # The schedule view and, on weekends, the tomorrow view read it
+            await fetch_diary(session, tomorrow, tomorrow)
+        except Exception as e:
+            if not is_no_schedule(e):
+                raise
+        if grades:
+            # Also stores the subject names, so the app can show the grades offline at once
+            await load_grades(
+                session, school_year_start(), datetime.date.today(), parser=parser or DEFAULT_PARSER,
+                concurrency=concurrency,
+            )
+
+async def run(args):
+    from config import load_config
+    from func import MAX_CONCURRENT_REQUESTS
+    from reports import get_report_parser, close_report_parser
+    from session import get_session, close_sessions
+
+    config = load_config()
+    session = get_session(config["username"], config["password"], config["school"])
+    concurrency = config.get("concurrency", MAX_CONCURRENT_REQUESTS)
+    # "parse_workers" in the config caps the processes parsing grade reports
+    get_report_parser(config.get("parse_workers"))
+    try:
+        while True:
+            try:
+                await refresh(session, concurrency, not args.no_grades, config.get("report_parser"))
+                print(f"{datetime.datetime.now():%d.%m %H:%M} Данные обновлены", flush=True)
+            except Exception as e:
+                # Try again on the next round
+                print(f"{datetime.datetime.now():%d.%m %H:%M} Ошибка обновления: {e}", file=sys.stderr, flush=True)
+                if args.once:
+                    return 1
+            if args.once:
+                return 0
+            await asyncio.sleep(next_delay(args.interval * 60, JITTER))
+    finally:
+        close_report_parser()
+        await close_sessions(logout=not config.get("keep_session", True))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Keep the local NetSchool data fresh in the background")
+    parser.add_argument("--interval", type=float, default=REFRESH_INTERVAL / 60, help="minutes between refreshes (±20%%)")
+    parser.add_argument("--once", action="store_true", help="refresh once and exit, e.g. from cron")
+    parser.add_argument("--no-grades", action="store_true", help="do not refresh grade reports")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        sys.exit(asyncio.run(run(args)))
+    except KeyboardInterrupt:
+        pass
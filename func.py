@@ -1,19 +1,95 @@
 import asyncio
-from netschoolapi import NetSchoolAPI
 import datetime
-import calendar
-import requests
+import time
+import sys
+from collections import OrderedDict
 import httpx
+from netschoolapi.schemas import Diary, DiarySchema
+from cache import get_cache, week_may_change, OfflineCacheMiss, SUBJECT_GROUP_REVALIDATE, CURRENT_WEEK_TTL, RECENT_CHANGE_WINDOW
+from records import Homework, HomeworkDiff, diff_homework
+from schools import get_school_index
+from tracing import tracer, traced
+from transport import get_transport
 
-async def search_schools(school_name):
+HOMEWORK_TYPE = 'Домашнее задание'
+NO_HOMEWORK = ('БЕЗ ДОМАШНЕГО ЗАДАНИЯ.', 'НЕ ЗАДАНО')
+
+# Upper bound on per-assignment requests that may be in flight at once
+MAX_CONCURRENT_REQUESTS = 6
+
+# Weeks of a range fetched at once (each week bounds its own assignment lookups)
+MAX_CONCURRENT_WEEKS = 4
+
+# Matches returned by a homework history search
+SEARCH_LIMIT = 50
+
+async def gather_limited(func, items, limit=MAX_CONCURRENT_REQUESTS):
+    """Await func(item) for every item with at most `limit` calls in flight.
+
+    Results keep the order of `items`; a failed call yields its exception
+    instead of a result, so one bad item does not lose the whole batch.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(item):
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+
+# Loads in progress by key, shared by every caller that asks for the same data
+_in_flight = {}
+
+async def single_flight(key, load):
+    """Await load() once for all concurrent callers with the same key.
+
+    A caller that is cancelled stops waiting, but the shared load goes on for
+    the others (and still fills the cache).
+    """
+    task = _in_flight.get(key)
+    if task is None:
+        task = _in_flight[key] = asyncio.ensure_future(load())
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(task)
+
+# Recent school searches by lowercased query, least recently used first
+SCHOOL_SEARCH_CACHE_SIZE = 64
+_school_searches = OrderedDict()
+
+def cached_school_search(school_name):
+    """Return cached search results for a query, or None.
+
+    The server matches the query anywhere in the school name, so the results
+    for a shorter prefix of the query already contain every match and only
+    need to be filtered.
+    """
+    query = school_name.lower()
+    for length in range(len(query), 0, -1):
+        prefix = query[:length]
+        if prefix in _school_searches:
+            _school_searches.move_to_end(prefix)
+            schools = _school_searches[prefix]
+            if length == len(query):
+                return schools
+            return [school for school in schools if query in school["shortName"].lower()]
+    return None
+
+async def search_schools(school_name, transport=None):
     """Search for schools by name and return a list of matches."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"https://sgo.rso23.ru/schools/search?name={school_name}")
-        if response.status_code == 200:
-            return response.json()
-        return []
+    schools = cached_school_search(school_name)
+    if schools is not None:
+        return schools
+    async with httpx.AsyncClient(transport=transport or get_transport()) as client:
+        response = await client.get("https://sgo.rso23.ru/schools/search", params={"name": school_name})
+        if response.status_code != 200:
+            return []
+        schools = response.json()
+    _school_searches[school_name.lower()] = schools
+    while len(_school_searches) > SCHOOL_SEARCH_CACHE_SIZE:
+        _school_searches.popitem(last=False)
+    return schools
 
-async def find_school_id(school_name):
+async def find_school_id(school_name, transport=None):
     """Find a school ID by name, trying different approaches."""
     # First try to convert to int if it's a numeric string
     try:
@@ -21,8 +97,15 @@ async def find_school_id(school_name):
     except ValueError:
         pass
     
+    # Resolve from the local school directory when we have one
+    index = await get_school_index(transport=transport)
+    if len(index):
+        school = index.find(school_name)
+        if school:
+            return school["id"]
+    
     # Search for schools
-    schools = await search_schools(school_name)
+    schools = await search_schools(school_name, transport)
     
     # Try exact match first
     for school in schools:
@@ -46,7 +129,7 @@ async def find_school_id(school_name):
     # If all else fails, try to use the school name as is
     return school_name
 
-async def assign_to_lesson(assignment_id, student_id, token, api_instance):
+async def get_assignment(assignment_id, student_id, token, api_instance):
     request = api_instance._wrapped_client.client.build_request(
         method="GET",
         url=f'student/diary/assigns/{assignment_id}',
@@ -57,92 +140,388 @@ async def assign_to_lesson(assignment_id, student_id, token, api_instance):
         None,
         request,
     )
-    response = response.json()
+    return response.json()
+
+async def assign_to_lesson(assignment_id, student_id, token, api_instance):
+    response = await get_assignment(assignment_id, student_id, token, api_instance)
     if response['isDeleted']:
         return None
     else: return response['subjectGroup']['name']
 
-async def main(user_name, password, school_name_or_id):
-    # Create a fresh API instance for each request
-    api_instance = NetSchoolAPI('https://sgo.rso23.ru/')
-    
-    # Try to find the school ID if it's a string
-    if isinstance(school_name_or_id, str):
+def subject_groups_to_fetch(homeworks, memo):
+    """Return the homeworks whose subject group is not in `memo`, or is open
+    and its deletion status is getting old."""
+    today = datetime.date.today()
+    stale = time.time() - SUBJECT_GROUP_REVALIDATE
+    return [
+        hw for hw in homeworks
+        if hw.id not in memo or ((hw.deadline >= today or hw.is_duty) and memo[hw.id][2] < stale)
+    ]
+
+async def lookup_subject_groups(homeworks, session, concurrency=MAX_CONCURRENT_REQUESTS):
+    """Return the subject group name of every homework (None if deleted).
+
+    Names are memoized on disk; only unknown assignments, and open ones whose
+    deletion status is getting old, are fetched, so a fully memoized list
+    needs no login. A failed lookup yields its exception in place of the name.
+    """
+    cache = get_cache()
+    memo = cache.get_subject_groups(hw.id for hw in homeworks)
+    to_fetch = subject_groups_to_fetch(homeworks, memo)
+    responses = []
+    if to_fetch:
+        api_instance = await session.get_api()
+        token = api_instance._access_token
+        student_id = api_instance._student_id
+        with tracer.span("subject groups", memoized=len(homeworks) - len(to_fetch), fetched=len(to_fetch)):
+            responses = await gather_limited(
+                lambda hw: get_assignment(hw.id, student_id, token, api_instance),
+                to_fetch,
+                concurrency,
+            )
+
+    fetched = {}
+    entries = []
+    for hw, response in zip(to_fetch, responses):
+        if isinstance(response, Exception):
+            fetched[hw.id] = response
+            continue
+        subject_group = response.get('subjectGroup') or {}
+        entries.append((hw.id, subject_group.get('name'), response['isDeleted']))
+        fetched[hw.id] = None if response['isDeleted'] else subject_group.get('name')
+    cache.put_subject_groups(entries)
+
+    names = []
+    for hw in homeworks:
+        if hw.id in fetched:
+            names.append(fetched[hw.id])
+        else:
+            name, is_deleted, _ = memo[hw.id]
+            names.append(None if is_deleted else name)
+    return names
+
+def current_week():
+    """Return (monday, saturday) of the current week."""
+    start = datetime.date.today() - datetime.timedelta(days=datetime.date.today().weekday())
+    return start, start + datetime.timedelta(days=5)
+
+def school_year_start(today=None):
+    """Return September 1st of the school year `today` belongs to."""
+    today = today or datetime.date.today()
+    return datetime.date(today.year if today.month >= 9 else today.year - 1, 9, 1)
+
+def week_chunks(start, end):
+    """Split start..end into Monday to Sunday chunks, clipped to the range."""
+    chunks = []
+    monday = start - datetime.timedelta(days=start.weekday())
+    while monday <= end:
+        chunks.append((max(start, monday), min(end, monday + datetime.timedelta(days=6))))
+        monday += datetime.timedelta(days=7)
+    return chunks
+
+def is_no_schedule(error):
+    """Tell whether the server refused a range because it has no schedule for it yet."""
+    return "5288" in str(error)
+
+async def gather_weeks(func, start, end, limit=MAX_CONCURRENT_WEEKS):
+    """Await func(week_start, week_end) for every week of start..end, `limit` at a time.
+
+    Results are in date order; the first failure is raised once all weeks are done.
+    """
+    results = await gather_limited(lambda chunk: func(*chunk), week_chunks(start, end), limit)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+async def fetch_diary(session, start=None, end=None, offline=False, max_age=None):
+    """Return the diary for start..end, served from the local cache when fresh.
+
+    In offline mode the cache is the only source, even if the entry expired.
+    `max_age` (seconds) refetches cached entries older than that.
+    """
+    if not start:
+        start = current_week()[0]
+    if not end:
+        end = start + datetime.timedelta(days=5)
+
+    async def load():
+        with tracer.span("diary", start=start.isoformat(), end=end.isoformat()) as details:
+            diary, details["source"] = await _load_diary(session, get_cache(), start, end, offline, max_age)
+        return diary
+
+    return await single_flight(("diary", session.account, start, end, offline, max_age), load)
+
+async def _load_diary(session, cache, start, end, offline, max_age):
+    payload = cache.get_diary(session.account, start, end, allow_stale=offline, max_age=max_age)
+    source = "cache"
+    if payload is None:
+        if offline:
+            raise OfflineCacheMiss(f"{start.isoformat()} - {end.isoformat()}")
+        api_instance = await session.get_api()
+        response = await api_instance._request_with_optional_relogin(
+            None,
+            api_instance._wrapped_client.client.build_request(
+                method="GET",
+                url="student/diary",
+                params={
+                    'studentId': api_instance._student_id,
+                    'yearId': api_instance._year_id,
+                    'weekStart': start.isoformat(),
+                    'weekEnd': end.isoformat(),
+                },
+            ),
+        )
+        payload = response.json()
+        source = "network"
+        cache.put_diary(session.account, start, end, payload)
+        cache.put_meta(session.account, 'assignment_types', api_instance._assignment_types)
+        assignment_types = api_instance._assignment_types
+    else:
+        assignment_types = {
+            int(k): v for k, v in cache.get_meta(session.account, 'assignment_types', {}).items()
+        }
+
+    diary_schema = DiarySchema()
+    diary_schema.context['assignment_types'] = assignment_types
+    return diary_schema.load(payload), source
+
+async def fetch_diary_range(session, start, end, offline=False, weeks=MAX_CONCURRENT_WEEKS):
+    """Return one diary for any start..end (up to a whole term), fetched week by week in parallel."""
+    async def fetch_week(week_start, week_end):
         try:
-            school_id = await find_school_id(school_name_or_id)
-            school_name_or_id = school_id
+            return await fetch_diary(session, week_start, week_end, offline)
+        except OfflineCacheMiss:
+            raise
         except Exception as e:
-            print(f"Error finding school ID: {e}")
-            # Continue with the original value
-    
-    await api_instance.login(
-        user_name,
-        password,
-        school_name_or_id
+            if is_no_schedule(e):
+                return Diary(week_start, week_end, [])
+            raise
+
+    with tracer.span("diary range", start=start.isoformat(), end=end.isoformat()):
+        diaries = await gather_weeks(fetch_week, start, end, weeks)
+    schedule = sorted((day for diary in diaries for day in diary.schedule), key=lambda day: day.day)
+    return Diary(start, end, schedule)
+
+def subject_name(subject_group):
+    """Turn a subject group name like '10А/Алгебра' into the subject."""
+    parts = subject_group.split('/')
+    return parts[1] if len(parts) > 1 else subject_group
+
+def has_homework(assignment):
+    """Check that an assignment is an actual homework, graded or not."""
+    return (
+        assignment.type == HOMEWORK_TYPE
+        and assignment.content.strip() != ''
+        and assignment.content.upper() not in NO_HOMEWORK
     )
-    token = api_instance._access_token
-    studentId = api_instance._student_id
-    diary = await api_instance.diary()
-    days = 0
-    if diary.end.month != diary.start.month:
-        _, month_days = calendar.monthrange(diary.start.year, diary.start.month)
-        days = diary.start.day + diary.end.day - month_days
-    else:
-        days = diary.end.day - diary.start.day + 1
-    if not diary.schedule:
-        print('На этой неделе выходные.')
-        await api_instance.logout()
-        return None
-    schedule = diary.schedule
-    today = datetime.date.today()
-    tommorow = today + datetime.timedelta(days=1)
-    month = datetime.date.today().month
-    assignments = []
-    tom_assignments = []
-    assignsId = []
+
+def is_homework(assignment):
+    """Check that an assignment is an actual homework that has not been graded yet."""
+    return has_homework(assignment) and assignment.mark is None
+
+async def resolve_homeworks(session, homeworks, subjects, concurrency=MAX_CONCURRENT_REQUESTS, offline=False):
+    """Look up the subject of every homework and turn them into Homework records.
+
+    `subjects` maps assignment ids to the subject of the lesson they were found
+    in; it is used offline, when subject groups cannot be fetched.
+    """
     ret = []
-    for weekday in range(days):
-        lessons = schedule[weekday].lessons
-        for lesson in lessons:
-            for assignment in lesson.assignments:
-                if assignment.type == 'Домашнее задание' and assignment.mark is None and assignment.content.upper() != 'БЕЗ ДОМАШНЕГО ЗАДАНИЯ.' and assignment.content.upper() != 'НЕ ЗАДАНО' and (assignment.deadline > today or assignment.is_duty == True) and (assignment.deadline.month == month or diary.end.month != diary.start.month): # Checking out that it is H/W
-                    assignments.append(assignment)
-                    assignsId.append(assignment.id)
-                    if assignment.deadline == tommorow:
-                        tom_assignments.append(assignment)
-                        assignments.remove(assignment)
-    
-    # Process tomorrow's assignments
-    for hw in tom_assignments:
-        asslesson = await assign_to_lesson(hw.id, studentId, token, api_instance)
-        if asslesson is not None:
-            asslesson = asslesson.split('/')[1]
-            duty = hw.is_duty
-            deadline = datetime.datetime.strftime(hw.deadline, '%d.%m (%Y)')
-            content = hw.content
-            comment = hw.comment if hw.comment else None
-            ret.append([asslesson, duty, deadline, content, comment])
-    
-    # Process other assignments
-    for hw in assignments:
-        asslesson = await assign_to_lesson(hw.id, studentId, token, api_instance)
+    if not homeworks:
+        return ret
+    if offline:
+        # Only memoized subject groups are known offline, fall back to the lesson's subject
+        memo = get_cache().get_subject_groups(hw.id for hw in homeworks)
+        lessons = [
+            subject_name(memo[hw.id][0]) if memo.get(hw.id, (None,))[0] else subjects[hw.id]
+            for hw in homeworks
+        ]
+    else:
+        lessons = await lookup_subject_groups(homeworks, session, concurrency)
+        lessons = [
+            subject_name(lesson) if isinstance(lesson, str) else lesson
+            for lesson in lessons
+        ]
+    for hw, asslesson in zip(homeworks, lessons):
+        if isinstance(asslesson, Exception):
+            print(f"Error loading assignment {hw.id}: {asslesson}", file=sys.stderr)
+            continue
         if asslesson is not None:
-            asslesson = asslesson.split('/')[1]
-            duty = hw.is_duty
-            deadline = datetime.datetime.strftime(hw.deadline, '%d.%m (%Y)')
-            content = hw.content
-            comment = hw.comment if hw.comment else None
-            ret.append([asslesson, duty, deadline, content, comment])
+            ret.append(Homework(hw.id, asslesson, hw.is_duty, hw.deadline, hw.content, hw.comment or None))
     
-    await api_instance.logout()
     return ret
 
-async def get_tomorrow_assignments(user_name, password, school_name_or_id):
-    all_assignments = await main(user_name, password, school_name_or_id)
-    if not all_assignments:
-        return []
-    
+async def sync_homework(session, start, end, concurrency=MAX_CONCURRENT_REQUESTS, offline=False):
+    """Bring the open homework of start..end up to date; return it and what changed.
+
+    The last known state of every range is kept in the cache. Past weeks that
+    have not changed recently are served from it without any request; other
+    ranges are compared with the diary and only new assignments have their
+    subject looked up. Offline, the stored state is returned as is.
+    Concurrent syncs of the same range share one run.
+    """
+    return await single_flight(
+        ("sync", session.account, start, end, offline),
+        lambda: _sync_homework(session, start, end, concurrency, offline),
+    )
+
+async def _sync_homework(session, start, end, concurrency, offline):
+    cache = get_cache()
+    snapshot = cache.get_homework(session.account, start, end)
+    old = {}
+    # A range seen for the first time has not changed as far as we know
+    changed_at = 0
+    if snapshot:
+        rows, _, changed_at = snapshot
+        old = {homework.id: homework for homework in map(Homework.from_row, rows)}
+        if offline or not week_may_change(end, changed_at):
+            return list(old.values()), HomeworkDiff([], [], [])
+
+    # A past week edited lately may be cached for a month, look at it again
+    recently_changed = snapshot and end < current_week()[0] and changed_at > time.time() - RECENT_CHANGE_WINDOW
+    diary = await fetch_diary(session, start, end, offline, CURRENT_WEEK_TTL if recently_changed else None)
+
+    today = datetime.date.today()
+    candidates = []
+    subjects = {}
+    # Every homework of the range, past and graded ones too, goes to the searchable history
+    history = []
+    for day in diary.schedule:
+        for lesson in day.lessons:
+            for assignment in lesson.assignments:
+                if has_homework(assignment):
+                    history.append(Homework(
+                        assignment.id, lesson.subject, assignment.is_duty,
+                        assignment.deadline, assignment.content, assignment.comment or None,
+                    ))
+                if is_homework(assignment) and (assignment.deadline >= today or assignment.is_duty):
+                    subjects[assignment.id] = lesson.subject
+                    # The subject of a known assignment never changes, keep it
+                    known = old.get(assignment.id)
+                    candidates.append(Homework(
+                        assignment.id, known.lesson if known else None, assignment.is_duty,
+                        assignment.deadline, assignment.content, assignment.comment or None,
+                    ))
+
+    diff = diff_homework(old, candidates)
+    # Known open assignments are looked up again once their deletion status gets old
+    known = [homework for homework in candidates if homework.lesson is not None]
+    revalidate = subject_groups_to_fetch(known, cache.get_subject_groups(homework.id for homework in known))
+    with tracer.span("sync", added=len(diff.added), removed=len(diff.removed), changed=len(diff.changed)):
+        resolved = await resolve_homeworks(session, diff.added + revalidate, subjects, concurrency, offline)
+    by_id = {homework.id: homework for homework in resolved}
+    deleted = {
+        id for id, (_, is_deleted, _) in cache.get_subject_groups(homework.id for homework in revalidate).items()
+        if is_deleted
+    }
+    # Deleted assignments and failed lookups of new ones are left out, the latter are retried next time
+    homeworks = [
+        homework if homework.lesson is not None else by_id[homework.id]
+        for homework in candidates
+        if homework.id not in deleted and (homework.lesson is not None or homework.id in by_id)
+    ]
+    added = [homework for homework in resolved if homework.id not in old]
+    removed = diff.removed + [old[id] for id in deleted]
+    diff = HomeworkDiff(added, removed, [homework for homework in diff.changed if homework.id not in deleted])
+
+    if not offline:
+        if snapshot and diff:
+            changed_at = time.time()
+        cache.put_homework(session.account, start, end, [homework.to_row() for homework in homeworks], changed_at)
+        # Open homework is indexed under its resolved subject name
+        resolved_names = {homework.id: homework.lesson for homework in homeworks}
+        cache.index_homework(session.account, [
+            homework._replace(lesson=resolved_names.get(homework.id, homework.lesson)).to_row()
+            for homework in history
+        ])
+    return homeworks, diff
+
+def search_homework(session, query, start=None, end=None, limit=SEARCH_LIMIT):
+    """Search every homework synced so far, best matches first; no request is made.
+
+    Words match as prefixes, `start` and `end` limit the deadlines.
+    """
+    with tracer.span("search", "cache", query=query) as span:
+        rows = get_cache().search_homework(session.account, query, start, end, limit)
+        span["results"] = len(rows)
+    return [Homework.from_row(row) for row in rows]
+
+@traced("range")
+async def sync_homework_range(session, start, end, concurrency=MAX_CONCURRENT_REQUESTS, offline=False,
+                              weeks=MAX_CONCURRENT_WEEKS):
+    """sync_homework() over any start..end, week chunks synced in parallel.
+
+    Returns the open homework in date order and the combined changes.
+    """
+    async def sync_week(week_start, week_end):
+        try:
+            return await sync_homework(session, week_start, week_end, concurrency, offline)
+        except OfflineCacheMiss:
+            raise
+        except Exception as e:
+            if is_no_schedule(e):
+                return [], HomeworkDiff([], [], [])
+            raise
+
+    homeworks = []
+    diff = HomeworkDiff([], [], [])
+    for week, week_diff in await gather_weeks(sync_week, start, end, weeks):
+        homeworks += week
+        diff.added.extend(week_diff.added)
+        diff.removed.extend(week_diff.removed)
+        diff.changed.extend(week_diff.changed)
+    return homeworks, diff
+
+@traced("main")
+async def main(session, concurrency=MAX_CONCURRENT_REQUESTS, offline=False):
+    start, end = current_week()
+    homeworks, _ = await sync_homework(session, start, end, concurrency, offline)
+    today = datetime.date.today()
+    tommorow = today + datetime.timedelta(days=1)
+    month = today.month
+    # Open homework of this month (of the whole week across a month boundary)
+    homeworks = [
+        homework for homework in homeworks
+        if (homework.deadline > today or homework.is_duty)
+        and (homework.deadline.month == month or end.month != start.month)
+    ]
+    # Tomorrow's assignments go first, then the rest, as before
+    return (
+        [homework for homework in homeworks if homework.deadline == tommorow]
+        + [homework for homework in homeworks if homework.deadline != tommorow]
+    )
+
+@traced("tomorrow")
+async def get_tomorrow_assignments(session, concurrency=MAX_CONCURRENT_REQUESTS, offline=False):
+    """Return the homework due tomorrow, whichever lesson it was set in.
+
+    Looks through this week's diary (the one main() uses) and, when tomorrow
+    is past it, tomorrow's own; only the homework due tomorrow has its
+    subject looked up.
+    """
     tommorow = datetime.date.today() + datetime.timedelta(days=1)
-    tommorow_str = datetime.datetime.strftime(tommorow, '%d.%m (%Y)')
-    
-    return [assignment for assignment in all_assignments if assignment[2] == tommorow_str] 
\ No newline at end of file
+    ranges = [current_week()]
+    if tommorow > ranges[0][1]:
+        ranges.append((tommorow, tommorow))
+
+    candidates = {}
+    subjects = {}
+    for start, end in ranges:
+        try:
+            diary = await fetch_diary(session, start, end, offline)
+        except OfflineCacheMiss:
+            # Offline, the week is enough; tomorrow's own day is rarely cached
+            if (start, end) != ranges[0]:
+                continue
+            raise
+        except Exception as e:
+            if is_no_schedule(e):
+                continue
+            raise
+        for day in diary.schedule:
+            for lesson in day.lessons:
+                for assignment in lesson.assignments:
+                    if is_homework(assignment) and assignment.deadline == tommorow:
+                        candidates.setdefault(assignment.id, assignment)
+                        subjects.setdefault(assignment.id, lesson.subject)
+    return await resolve_homeworks(session, list(candidates.values()), subjects, concurrency, offline)
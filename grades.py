@@ -1,8 +1,25 @@
 from datetime import datetime
 from typing import List, Dict, Optional, Any
 from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 import re
 
+# Backends Grades can parse a report with: BeautifulSoup with the stdlib or the
+# lxml tree builder, or a streaming tokenizer that builds no tree at all.
+# lxml is optional (pip install lxml)
+try:
+    import lxml
+    PARSERS = ('html.parser', 'lxml', 'stream')
+except ImportError:
+    PARSERS = ('html.parser', 'stream')
+DEFAULT_PARSER = 'html.parser'
+
+# Elements that never have children or a closing tag
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr',
+}
+
 class Assignment:
     def __init__(self, type: str, theme: str, date: datetime, issue_date: datetime, mark: float):
         self.type = type
@@ -20,19 +37,138 @@ class Assignment:
             'mark': self.mark
         }
 
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Assignment':
+        return cls(
+            type=data['type'],
+            theme=data['theme'],
+            date=_from_isoformat(data['date']),
+            issue_date=_from_isoformat(data['issue_date']),
+            mark=data['mark']
+        )
+
+def _from_isoformat(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+class _ReportTokenizer(HTMLParser):
+    """Walk a report once, keeping only the text Grades needs.
+
+    Mirrors the selectors of the BeautifulSoup path: the first
+    `table td:nth-child(2) > span:nth-child(N)` for the date range and the
+    teacher, and the rows of the first `.table-print` table.
+    """
+
+    def __init__(self, date_span: int, teacher_span: int):
+        super().__init__(convert_charrefs=True)
+        self.date_span = date_span
+        self.teacher_span = teacher_span
+        self.dates_text: Optional[str] = None
+        self.teacher_text: Optional[str] = None
+        self.rows: List[List[str]] = []
+        self.row_classes: List[List[str]] = []
+        # Stack of [tag, classes, nth-child index, number of children]
+        self._stack: List[list] = [['', [], 1, 0]]
+        self._tables = 0
+        self._table_print_depth: Optional[int] = None
+        self._table_print_done = False
+        # Open text captures: [depth, buffer, callback]
+        self._captures: List[list] = []
+
+    def handle_starttag(self, tag, attrs):
+        parent = self._stack[-1]
+        parent[3] += 1
+        index = parent[3]
+        if tag in VOID_ELEMENTS:
+            return
+        classes = (dict(attrs).get('class') or '').split()
+        self._stack.append([tag, classes, index, 0])
+        depth = len(self._stack)
+
+        if tag == 'table':
+            self._tables += 1
+        elif tag == 'span' and self._tables and parent[0] == 'td' and parent[2] == 2:
+            if index == self.date_span and self.dates_text is None:
+                self._capture(depth, 'dates_text')
+            elif index == self.teacher_span and self.teacher_text is None:
+                self._capture(depth, 'teacher_text')
+
+        if self._table_print_depth is None:
+            if 'table-print' in classes and not self._table_print_done:
+                self._table_print_depth = depth
+        elif tag == 'tr':
+            self.rows.append([])
+            self.row_classes.append(classes)
+        elif tag == 'td' and self.rows:
+            self.rows[-1].append('')
+            self._capture(depth, self.rows[-1])
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        # Close up to the most recent matching element, ignore stray end tags
+        for i in range(len(self._stack) - 1, 0, -1):
+            if self._stack[i][0] == tag:
+                break
+        else:
+            return
+        while len(self._stack) > i:
+            self._pop()
+
+    def handle_data(self, data):
+        # Text of nested elements also belongs to the enclosing captures
+        for capture in self._captures:
+            capture[1].append(data)
+
+    def close(self):
+        super().close()
+        while len(self._stack) > 1:
+            self._pop()
+
+    def _capture(self, depth, target):
+        self._captures.append([depth, [], target])
+
+    def _pop(self):
+        depth = len(self._stack)
+        if self._stack.pop()[0] == 'table':
+            self._tables -= 1
+        while self._captures and self._captures[-1][0] == depth:
+            _, buffer, target = self._captures.pop()
+            text = ''.join(buffer)
+            if isinstance(target, list):
+                target[-1] = text
+            else:
+                setattr(self, target, text)
+        if self._table_print_depth == depth:
+            self._table_print_depth = None
+            self._table_print_done = True
+
 class Grades:
-    def __init__(self, html_text: str, assignment_types: List[str], has_terms: bool = False):
+    def __init__(self, html_text: str, assignment_types: List[str], has_terms: bool = False,
+                 parser: str = DEFAULT_PARSER):
+        if parser not in PARSERS:
+            raise ValueError(f"Unknown parser {parser!r}, expected one of {PARSERS}")
         self.raw = html_text
         self._types = assignment_types
         self.has_terms = has_terms
-        
-        # Parse the HTML
-        soup = BeautifulSoup(html_text, 'html.parser')
-        
+        self._assignments: Optional[List[Assignment]] = None
+
+        # Parse the HTML once, keeping the assignment rows for later
+        date_span, teacher_span = (5, 11) if has_terms else (3, 9)
+        if parser == 'stream':
+            dates_text, teacher_text, average_text, self._rows = self._tokenize(
+                html_text, date_span, teacher_span
+            )
+        else:
+            dates_text, teacher_text, average_text, self._rows = self._select(
+                BeautifulSoup(html_text, parser), date_span, teacher_span
+            )
+
         # Extract date range
         date_pattern = r'(\d{1,2}\.\d{1,2}\.\d{2})'
-        date_spans = soup.select(f'table td:nth-child(2) > span:nth-child({5 if has_terms else 3})')
-        dates = re.findall(date_pattern, date_spans[0].text if date_spans else '')
+        dates = re.findall(date_pattern, dates_text or '')
         
         self.range = {
             'start': self._parse_date(dates[0]) if len(dates) > 0 else None,
@@ -40,19 +176,68 @@ class Grades:
         }
         
         # Extract teacher name
-        teacher_span = soup.select(f'table td:nth-child(2) > span:nth-child({11 if has_terms else 9})')
-        self.teacher = teacher_span[0].text.strip() if teacher_span else ""
+        self.teacher = teacher_text.strip() if teacher_text is not None else ""
         
         # Extract average mark
-        average_mark_td = soup.select_one('.table-print tr.totals td:nth-child(3)')
-        if average_mark_td:
-            mark_text = average_mark_td.text.strip()
+        if average_text is not None:
+            mark_text = average_text.strip()
             mark_text = mark_text.replace(',', '.')
             mark_text = re.sub(r'^\D+(?=\d)', '', mark_text)
             self.average_mark = float(mark_text) if mark_text else 0.0
         else:
             self.average_mark = 0.0
 
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], assignment_types: List[str], has_terms: bool = False) -> 'Grades':
+        """Rebuild Grades from to_dict() output without parsing the HTML again."""
+        grades = cls.__new__(cls)
+        grades.raw = data['raw']
+        grades._types = assignment_types
+        grades.has_terms = has_terms
+        grades._rows = []
+        grades.range = {
+            'start': _from_isoformat(data['range']['start']),
+            'end': _from_isoformat(data['range']['end'])
+        }
+        grades.teacher = data['teacher']
+        grades.average_mark = data['average_mark']
+        grades._assignments = [Assignment.from_dict(assignment) for assignment in data['assignments']]
+        return grades
+
+    @staticmethod
+    def _select(soup, date_span: int, teacher_span: int):
+        date_spans = soup.select(f'table td:nth-child(2) > span:nth-child({date_span})')
+        teacher_spans = soup.select(f'table td:nth-child(2) > span:nth-child({teacher_span})')
+        average_mark_td = soup.select_one('.table-print tr.totals td:nth-child(3)')
+
+        rows = []
+        table = soup.select_one('.table-print')
+        if table:
+            # Skip the last row (totals)
+            rows = [[cell.text for cell in row.select('td')] for row in table.select('tr')[:-1]]
+
+        return (
+            date_spans[0].text if date_spans else None,
+            teacher_spans[0].text if teacher_spans else None,
+            average_mark_td.text if average_mark_td else None,
+            rows,
+        )
+
+    @staticmethod
+    def _tokenize(html_text: str, date_span: int, teacher_span: int):
+        tokenizer = _ReportTokenizer(date_span, teacher_span)
+        tokenizer.feed(html_text)
+        tokenizer.close()
+
+        average_text = None
+        for row, classes in zip(tokenizer.rows, tokenizer.row_classes):
+            if 'totals' in classes and len(row) >= 3:
+                average_text = row[2]
+                break
+
+        # Skip the last row (totals)
+        return tokenizer.dates_text, tokenizer.teacher_text, average_text, tokenizer.rows[:-1]
+
     def _parse_date(self, date_str: str) -> Optional[datetime]:
         try:
             return datetime.strptime(date_str, '%d.%m.%y')
@@ -61,24 +246,17 @@ class Grades:
 
     @property
     def assignments(self) -> List[Assignment]:
+        if self._assignments is not None:
+            return self._assignments
+
         assignments = []
-        soup = BeautifulSoup(self.raw, 'html.parser')
-        table = soup.select_one('.table-print')
-        
-        if not table:
-            return assignments
-            
-        # Skip the last row (totals)
-        rows = table.select('tr')[:-1]
-        
-        for row in rows:
-            cells = row.select('td')
+        for cells in self._rows:
             if len(cells) >= 5:
-                type_cell = cells[0].text.strip()
-                theme_cell = cells[1].text.strip()
-                date_cell = cells[2].text.strip()
-                issue_date_cell = cells[3].text.strip()
-                mark_cell = cells[4].text.strip()
+                type_cell = cells[0].strip()
+                theme_cell = cells[1].strip()
+                date_cell = cells[2].strip()
+                issue_date_cell = cells[3].strip()
+                mark_cell = cells[4].strip()
                 
                 assignment = Assignment(
                     type=type_cell,
@@ -89,6 +267,7 @@ class Grades:
                 )
                 assignments.append(assignment)
         
+        self._assignments = assignments
         return assignments
 
     def to_dict(self) -> Dict[str, Any]:
@@ -102,3 +281,13 @@ class Grades:
             'average_mark': self.average_mark,
             'assignments': [assignment.to_dict() for assignment in self.assignments]
         }
+
+def parse_report(html_text: str, assignment_types: List[str], has_terms: bool = False,
+                 parser: str = DEFAULT_PARSER) -> Dict[str, Any]:
+    """Parse a report into plain, picklable data for Grades.from_dict().
+
+    Runs in the workers of reports.ReportParser; the HTML is not sent back.
+    """
+    data = Grades(html_text, assignment_types, has_terms, parser).to_dict()
+    del data['raw']
+    return data
@@ -2,18 +2,35 @@ from textual.app import App, ComposeResult
 from textual.containers import Container, Vertical
 from textual.widgets import Header, Footer, Button, Static, Label, Input, Select
 from textual.reactive import reactive
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+from textual.geometry import Size
+from rich.text import Text
 from textual import events
+import argparse
 import asyncio
 import json
 import os
 import platform
+import tempfile
 from pathlib import Path
-from func import get_tomorrow_assignments, main, search_schools, find_school_id
+from func import (get_tomorrow_assignments, main, search_schools, find_school_id, fetch_diary, school_year_start,
+                  search_homework, MAX_CONCURRENT_REQUESTS)
+from cache import OfflineCacheMiss
+from records import format_deadline
+from schools import get_school_index, current_school_index
+from cassette import RecordingTransport, ReplayTransport, use_scratch_state
+from tracing import tracer, traced, TracingTransport
+from transport import get_transport
 from config import get_credentials
+from session import get_session, close_sessions
+from reports import get_report_parser, close_report_parser, load_grades
+from grades import DEFAULT_PARSER
+from analytics import GradeTable, analyze, DEFAULT_TARGET, MAX_MARK
 from datetime import datetime, timedelta, date
 import httpx
 import socket
-from netschoolapi import errors, NetSchoolAPI
+from netschoolapi import errors
 from netschoolapi.schemas import Diary, Assignment
 
 def get_config_dir():
@@ -64,6 +81,9 @@ def save_config(username, password, school):
 class LoginScreen(Static):
     """A login screen for the application."""
     
+    # Seconds of typing inactivity before a school search is sent
+    SEARCH_DEBOUNCE = 0.3
+
     def __init__(self):
         super().__init__()
         self.username = ""
@@ -72,6 +92,8 @@ class LoginScreen(Static):
         self.is_first_run = load_config() is None
         self.schools = []
         self.searching = False
+        self._search_task = None
+        self._index_task = None
 
     def compose(self) -> ComposeResult:
         """Create child widgets for the login screen."""
@@ -94,21 +116,40 @@ class LoginScreen(Static):
             if not self.is_first_run:
                 yield Button("Пропустить", variant="default", id="skip-btn")
     
+    def on_mount(self) -> None:
+        # Load or refresh the school directory once, in the background; the
+        # download is shared and not cancelled by the searches
+        self._index_task = asyncio.create_task(get_school_index(transport=self.app.transport))
+
     def on_input_changed(self, event: Input.Changed) -> None:
         """Handle input changes."""
         if event.input.id == "school-input":
-            # Start a search for schools when the school input changes
-            asyncio.create_task(self.handle_school_search(event.input.value))
+            # Start a search for schools when the school input changes,
+            # dropping the one for the previous value
+            if self._search_task:
+                self._search_task.cancel()
+            self._search_task = asyncio.create_task(self.handle_school_search(event.input.value))
     
     async def handle_school_search(self, query):
         """Handle school search and UI updates."""
         if not query or len(query) < 3:
             return
         
+        index = current_school_index()
+        if not len(index):
+            # No local directory yet: wait until the user stops typing before
+            # going online, a newer keystroke cancels us here
+            await asyncio.sleep(self.SEARCH_DEBOUNCE)
+            # The directory may have been downloaded in the meantime
+            index = current_school_index()
+        
         self.searching = True
         try:
             # Perform the search
-            self.schools = await search_schools(query)
+            if len(index):
+                self.schools = index.search(query)
+            else:
+                self.schools = await search_schools(query, self.app.transport)
             
             # Update the UI
             await self.update_school_selector()
@@ -172,51 +213,148 @@ class LoginScreen(Static):
             if school_selector:
                 school_selector.remove()
 
-class AssignmentDisplay(Static):
-    def __init__(self, assignment):
-        super().__init__()
-        self.assignment = assignment
+def describe_homework(homework):
+    """Rich markup for one homework card."""
+    deadline = format_deadline(homework.deadline)
+    
+    text = f"[white]{homework.lesson}[/]\n"
+    text += f"[red]Срок сдачи: {deadline}[/]\n" if homework.is_duty else f"Срок сдачи: {deadline}\n"
+    text += f"{homework.content}"
+    if homework.comment:
+        text += f"\n[italic]{homework.comment}[/]"
+    return text
+
+def describe_lesson(lesson):
+    """Rich markup for one lesson card, with its homework."""
+    text = f"[bold]{lesson.number}. {lesson.subject}[/]\n"
+    text += f"Время: {lesson.start.strftime('%H:%M')} - {lesson.end.strftime('%H:%M')}"
+    if lesson.room:
+        text += f"\nКабинет: {lesson.room}"
+    
+    # Add homework if available
+    for assignment in lesson.assignments:
+        if assignment.type == 'Домашнее задание':
+            text += f"\n\n[red]Домашнее задание:[/]\n"
+            text += f"{assignment.content}\n"
+            if assignment.comment:
+                text += f"[italic]Комментарий: {assignment.comment}[/]\n"
+            text += f"Срок сдачи: {assignment.deadline.strftime('%d.%m.%Y')}"
+            if assignment.is_duty:
+                text += "\n[bold red]Внимание! Задолженность![/]"
+    return text
+
+def describe_subject(stats, target=DEFAULT_TARGET):
+    """Rich markup for one subject's grade statistics."""
+    text = f"[bold]{stats.subject}[/]\n"
+    text += f"Средняя: {stats.average:.2f}, взвешенная: {stats.weighted_average:.2f} (оценок: {stats.marks})\n"
+    color = "green" if stats.trend > 0.05 else "red" if stats.trend < -0.05 else "white"
+    text += f"Тренд: [{color}]{stats.trend:+.2f}[/] в месяц\n"
+    if stats.needed is None:
+        text += f"До {target:g}: [red]недостижимо[/]"
+    elif stats.needed == 0:
+        text += f"До {target:g}: [green]достигнуто[/]"
+    else:
+        text += f"До {target:g}: нужно оценок {MAX_MARK}: [bold]{stats.needed}[/]"
+    if stats.by_type:
+        text += "\n[italic]" + ", ".join(f"{kind}: {mark:.2f}" for kind, mark in sorted(stats.by_type.items())) + "[/]"
+    return text
+
+class RecordList(ScrollView):
+    """Scrollable list of cards that draws only the lines on screen.
+
+    Records are turned into Rich markup by `describe` and wrapped into cards
+    once per width; identical cards share the work across reloads. Records
+    are laid out BATCH_SIZE at a time between refreshes, so the first cards
+    of a long list show up at once.
+    """
 
-    def on_mount(self) -> None:
-        lesson, is_duty, deadline, content, comment = self.assignment
-        
-        text = f"[white]{lesson}[/]\n"
-        text += f"[red]Срок сдачи: {deadline}[/]\n" if is_duty else f"Срок сдачи: {deadline}\n"
-        text += f"{content}\n"
-        if comment:
-            text += f"[italic]{comment}[/]"
-        
-        self.mount(Label(text))
+    BATCH_SIZE = 200
 
-class LessonDisplay(Static):
-    def __init__(self, lesson, assignments=None):
-        super().__init__()
-        self.lesson = lesson
-        self.assignments = assignments
+    DEFAULT_CSS = """
+    RecordList {
+        height: 1fr;
+        scrollbar-gutter: stable;
+    }
+    """
 
-    def on_mount(self) -> None:
-        lesson_number, subject, room, teacher, start_time, end_time = self.lesson
-        
-        text = f"[bold]{lesson_number}. {subject}[/]\n"
-        text += f"Время: {start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}\n"
-        if room:
-            text += f"Кабинет: {room}\n"
-        if teacher:
-            text += f"Учитель: {teacher}\n"
-        
-        # Add homework if available
-        if self.assignments:
-            for assignment in self.assignments:
-                if assignment.type == 'Домашнее задание':
-                    text += f"\n[red]Домашнее задание:[/]\n"
-                    text += f"{assignment.content}\n"
-                    if assignment.comment:
-                        text += f"[italic]Комментарий: {assignment.comment}[/]\n"
-                    text += f"Срок сдачи: {assignment.deadline.strftime('%d.%m.%Y')}\n"
-                    if assignment.is_duty:
-                        text += "[bold red]Внимание! Задолженность![/]\n"
-        
-        self.mount(Label(text))
+    def __init__(self, describe, **kwargs):
+        super().__init__(**kwargs)
+        self.describe = describe
+        self.records = []
+        self._pending = []
+        self._flush_scheduled = False
+        self._restart = False
+        self._lines = []
+        self._width = 0
+        # Wrapped cards by markup: this generation and the one before the last set_records()
+        self._cards = {}
+        self._previous_cards = {}
+
+    def set_records(self, records):
+        """Replace the records; unchanged cards are not wrapped again."""
+        self._previous_cards, self._cards = self._cards, {}
+        # The old lines stay on screen until the first batch replaces them
+        self._pending = list(records)
+        self._restart = True
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.call_after_refresh(self._flush)
+
+    def _card(self, record):
+        markup = self.describe(record)
+        card = self._cards.get(markup) or self._previous_cards.get(markup)
+        if card is None:
+            inner = max(1, self._width - 4)
+            style = "on #111111"
+            card = [Text("┌" + "─" * (inner + 2) + "┐", style=style)]
+            for line in Text.from_markup(markup).wrap(self.app.console, inner):
+                line.pad_right(inner - line.cell_len)
+                card.append(Text.assemble("│ ", line, " │", style=style))
+            card.append(Text("└" + "─" * (inner + 2) + "┘", style=style))
+        self._cards[markup] = card
+        return card
+
+    def _flush(self):
+        self._flush_scheduled = False
+        width = self.scrollable_content_region.width
+        if width <= 0:
+            # Not laid out yet, on_resize comes back here
+            return
+        if width != self._width:
+            self._width = width
+            self._cards = {}
+            self._previous_cards = {}
+            if not self._restart:
+                self._pending = self.records + self._pending
+                self._restart = True
+        if self._restart:
+            self._restart = False
+            self.records = []
+            self._lines = []
+        batch, self._pending = self._pending[:self.BATCH_SIZE], self._pending[self.BATCH_SIZE:]
+        for record in batch:
+            self.records.append(record)
+            self._lines.extend(self._card(record))
+        self.virtual_size = Size(width, len(self._lines))
+        self.refresh()
+        if self._pending:
+            self._schedule_flush()
+
+    def on_resize(self, event: events.Resize) -> None:
+        if self.scrollable_content_region.width != self._width:
+            self._schedule_flush()
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, scroll_y = self.scroll_offset
+        index = scroll_y + y
+        width = self.scrollable_content_region.width
+        if index >= len(self._lines):
+            return Strip.blank(width, self.rich_style)
+        strip = Strip(list(self._lines[index].render(self.app.console, end="")))
+        return strip.crop_extend(scroll_x, scroll_x + width, self.rich_style)
 
 class ErrorOverlay(Static):
     """A custom overlay for displaying error messages."""
@@ -235,7 +373,37 @@ class ErrorOverlay(Static):
         if event.button.id == "error-ok-btn":
             self.remove()
 
+class StatsPanel(Static):
+    """Live request/phase timings collected by the tracer."""
+
+    def on_mount(self) -> None:
+        self.set_interval(1.0, self.refresh_stats)
+        self.refresh_stats()
+
+    def refresh_stats(self) -> None:
+        if not self.display:
+            return
+        lines = [f"{'':<6}{'операция':<42}{'кол-во':>7}{'всего, с':>10}{'макс, с':>9}{'кБ':>9}"]
+        summary = sorted(tracer.summary().items(), key=lambda item: -item[1]["total"])
+        for (category, name), entry in summary[:25]:
+            lines.append(
+                f"{category:<6}{name[:41]:<42}{entry['count']:>7}{entry['total']:>10.2f}"
+                f"{entry['max']:>9.2f}{entry['bytes'] / 1024:>9.1f}"
+            )
+        if len(lines) == 1:
+            lines.append("Запросов пока не было")
+        counters = tracer.counters
+        if counters.get("http responses"):
+            lines.append(
+                f"Ответов: {counters['http responses']}, по HTTP/2: {counters.get('http HTTP/2', 0)}, "
+                f"не изменилось (304): {counters.get('http 304', 0)}, "
+                f"сэкономлено: {counters.get('bytes saved', 0) / 1024:.1f} кБ"
+            )
+        self.update("\n".join(lines))
+
 class HomeworkApp(App):
+    BINDINGS = [("s", "toggle_stats", "Статистика")]
+
     CSS = """
     Screen {
         background: transparent;
@@ -253,15 +421,6 @@ class HomeworkApp(App):
         overflow-y: auto;
     }
 
-    AssignmentDisplay {
-        background: #111111;
-        padding: 1;
-        margin: 1;
-        border: solid white;
-        min-height: 5;
-        width: 100%;
-    }
-
     Button {
         margin: 1;
         border: solid white;
@@ -343,32 +502,49 @@ class HomeworkApp(App):
         color: white;
     }
 
-    LessonDisplay {
-        background: #111111;
-        padding: 1;
-        margin: 1;
-        border: solid white;
-        min-height: 5;
-        width: 100%;
-    }
-
     .schedule-header {
         text-align: center;
         padding: 1;
         color: white;
         text-style: bold;
     }
+
+    StatsPanel {
+        display: none;
+        background: #111111;
+        border: solid green;
+        padding: 0 1;
+        height: auto;
+    }
     """
 
-    def __init__(self):
+    def __init__(self, offline=False, transport=None, trace_path=None):
         super().__init__()
+        self.offline = offline
+        self.trace_path = trace_path
+        # Optional httpx transport for all traffic, e.g. to record or replay a cassette
+        self.transport = transport
         self.assignments = []
         self.loading = False
         self.username = ""
         self.password = ""
         self.school = ""
         self.is_logged_in = False
+        self.session = None
         self.api = None
+        self.concurrency = MAX_CONCURRENT_REQUESTS
+        self.keep_session = True
+        # Average to reach and the weights of assignment types in the grades view
+        self.target_mark = DEFAULT_TARGET
+        self.mark_weights = None
+        self.report_parser = DEFAULT_PARSER
+        # Homework or grades view on screen, updated in place on reload
+        self.shown_view = None
+        # The view shows stored data that is being revalidated
+        self.stale = False
+        # Load of the view requested last, see start_view
+        self.view_task = None
+        self.view_task_name = None
 
     def compose(self) -> ComposeResult:
         yield Header(show_clock=True)
@@ -379,6 +555,13 @@ class HomeworkApp(App):
             self.username = config["username"]
             self.password = config["password"]
             self.school = config["school"]
+            self.concurrency = config.get("concurrency", MAX_CONCURRENT_REQUESTS)
+            self.keep_session = config.get("keep_session", True)
+            self.target_mark = config.get("target_mark", DEFAULT_TARGET)
+            self.mark_weights = config.get("mark_weights")
+            self.report_parser = config.get("report_parser", DEFAULT_PARSER)
+            # Created here, with the configured size; it starts its workers on first use
+            get_report_parser(config.get("parse_workers"))
             self.is_logged_in = True
             
             # Show the main interface
@@ -386,11 +569,14 @@ class HomeworkApp(App):
                 yield Button("Показать задания на завтра", id="tomorrow-btn", variant="primary")
                 yield Button("Показать все задания", id="all-btn", variant="primary")
                 yield Button("Показать расписание на завтра", id="schedule-btn", variant="primary")
+                yield Button("Показать успеваемость", id="grades-btn", variant="primary")
+                yield Input(placeholder="Поиск по всем заданиям", id="search-input")
                 yield Vertical(id="assignments-container")
         else:
             # Show the login screen
             yield LoginScreen()
         
+        yield StatsPanel()
         yield Footer()
 
     def login_complete(self, username, password, school):
@@ -408,6 +594,8 @@ class HomeworkApp(App):
         main_container.mount(Button("Показать задания на завтра", id="tomorrow-btn", variant="primary"))
         main_container.mount(Button("Показать все задания", id="all-btn", variant="primary"))
         main_container.mount(Button("Показать расписание на завтра", id="schedule-btn", variant="primary"))
+        main_container.mount(Button("Показать успеваемость", id="grades-btn", variant="primary"))
+        main_container.mount(Input(placeholder="Поиск по всем заданиям", id="search-input"))
         main_container.mount(Vertical(id="assignments-container"))
         
         # Test login to verify credentials
@@ -416,9 +604,8 @@ class HomeworkApp(App):
     async def test_login(self):
         """Test login to verify credentials."""
         try:
-            # Create a temporary API instance to test login
+            # Log in once (or reuse the saved token); the session is kept for the views
             await self.initialize_api()
-            await self.api.logout()
         except httpx.ConnectError:
             self.show_error("Ошибка подключения", "Не удалось подключиться к серверу. Проверьте подключение к интернету.")
         except socket.gaierror:
@@ -428,6 +615,10 @@ class HomeworkApp(App):
             # Remove saved credentials if they're invalid
             if os.path.exists(CONFIG_FILE):
                 os.remove(CONFIG_FILE)
+            if self.session:
+                self.session.forget()
+            self.session = None
+            self.api = None
         except errors.SchoolNotFoundError as e:
             self.show_error("Школа не найдена", f"Ошибка: Школа не найдена. {e}")
         except errors.NoResponseFromServer:
@@ -438,37 +629,56 @@ class HomeworkApp(App):
             self.show_error("Неизвестная ошибка", f"Произошла неизвестная ошибка: {e}")
 
     async def initialize_api(self):
-        """Initialize NetSchoolAPI instance."""
-        if not self.api:
-            self.api = NetSchoolAPI('https://sgo.rso23.ru/')
-            await self.api.login(self.username, self.password, self.school)
+        """Get the logged-in NetSchoolAPI instance shared by all views."""
+        if not self.session:
+            self.session = get_session(self.username, self.password, self.school, self.transport)
+        # In offline mode everything comes from the cache, never log in
+        if not self.offline:
+            self.api = await self.session.get_api()
 
     def on_button_pressed(self, event: Button.Pressed) -> None:
         """Handle button press events."""
         if event.button.id == "tomorrow-btn":
-            asyncio.create_task(self.load_tomorrow_assignments())
+            self.start_view("tomorrow", self.load_tomorrow_assignments)
         elif event.button.id == "all-btn":
-            asyncio.create_task(self.load_all_assignments())
+            self.start_view("all", self.load_all_assignments)
         elif event.button.id == "schedule-btn":
-            asyncio.create_task(self.load_tomorrow_schedule())
+            self.start_view("schedule", self.load_tomorrow_schedule)
+        elif event.button.id == "grades-btn":
+            self.start_view("grades", self.load_grade_stats)
 
+    def on_input_changed(self, event: Input.Changed) -> None:
+        if event.input.id == "search-input":
+            self.start_view("search", lambda: self.search_history(event.value), restart=True)
+
+    def start_view(self, view, load, restart=False):
+        """Start loading a view.
+
+        Clicking a view that is still loading joins that load, unless
+        `restart` is set (a search for a new query); switching to another
+        view cancels the load of the previous one, so it cannot repaint the
+        screen after the new view; its requests already under way still
+        finish and fill the cache.
+        """
+        if self.view_task and not self.view_task.done():
+            if view == self.view_task_name and not restart:
+                return
+            self.view_task.cancel()
+        self.view_task_name = view
+        self.view_task = asyncio.create_task(load())
+
+    @traced("load tomorrow", "ui")
     async def load_tomorrow_assignments(self):
         self.loading = True
-        self.query_one("#assignments-container").remove_children()
-        self.query_one("#assignments-container").mount(Label("Загрузка..."))
+        self.begin_view("tomorrow")
         
         try:
-            assignments = await get_tomorrow_assignments(self.username, self.password, self.school)
-            
-            self.query_one("#assignments-container").remove_children()
-            if assignments:
-                self.query_one("#assignments-container").mount(Label(f"Найдено заданий: {len(assignments)}"))
-                
-                for assignment in assignments:
-                    display = AssignmentDisplay(assignment)
-                    self.query_one("#assignments-container").mount(display)
-            else:
-                self.query_one("#assignments-container").mount(Label("На завтра нет домашних заданий"))
+            await self.show_stored_homework("tomorrow", get_tomorrow_assignments, "На завтра нет домашних заданий")
+            await self.initialize_api()
+            assignments = await get_tomorrow_assignments(self.session, self.concurrency, self.offline)
+            self.show_homework("tomorrow", assignments, "На завтра нет домашних заданий")
+        except OfflineCacheMiss:
+            self.show_error("Нет сохраненных данных", "Эти данные еще не загружались, в автономном режиме они недоступны.")
         except httpx.ConnectError:
             self.show_error("Ошибка подключения", "Не удалось подключиться к серверу. Проверьте подключение к интернету.")
         except socket.gaierror:
@@ -485,24 +695,20 @@ class HomeworkApp(App):
             self.show_error("Неизвестная ошибка", f"Произошла неизвестная ошибка: {e}")
         finally:
             self.loading = False
+            self.mark_stale(False)
 
+    @traced("load all", "ui")
     async def load_all_assignments(self):
         self.loading = True
-        self.query_one("#assignments-container").remove_children()
-        self.query_one("#assignments-container").mount(Label("Загрузка..."))
+        self.begin_view("all")
         
         try:
-            assignments = await main(self.username, self.password, self.school)
-            
-            self.query_one("#assignments-container").remove_children()
-            if assignments:
-                self.query_one("#assignments-container").mount(Label(f"Найдено заданий: {len(assignments)}"))
-                
-                for assignment in assignments:
-                    display = AssignmentDisplay(assignment)
-                    self.query_one("#assignments-container").mount(display)
-            else:
-                self.query_one("#assignments-container").mount(Label("Нет домашних заданий"))
+            await self.show_stored_homework("all", main, "Нет домашних заданий")
+            await self.initialize_api()
+            assignments = await main(self.session, self.concurrency, self.offline)
+            self.show_homework("all", assignments, "Нет домашних заданий")
+        except OfflineCacheMiss:
+            self.show_error("Нет сохраненных данных", "Эти данные еще не загружались, в автономном режиме они недоступны.")
         except httpx.ConnectError:
             self.show_error("Ошибка подключения", "Не удалось подключиться к серверу. Проверьте подключение к интернету.")
         except socket.gaierror:
@@ -519,22 +725,29 @@ class HomeworkApp(App):
             self.show_error("Неизвестная ошибка", f"Произошла неизвестная ошибка: {e}")
         finally:
             self.loading = False
+            self.mark_stale(False)
 
+    @traced("load schedule", "ui")
     async def load_tomorrow_schedule(self):
         """Load and display tomorrow's schedule with assignments."""
         self.loading = True
-        self.query_one("#assignments-container").remove_children()
-        self.query_one("#assignments-container").mount(Label("Загрузка расписания..."))
+        self.begin_view("schedule", "Загрузка расписания...")
         
         try:
-            await self.initialize_api()
-            
             # Get diary data for tomorrow
             tomorrow = date.today() + timedelta(days=1)
+            stored = await self.load_stored(fetch_diary, tomorrow, tomorrow, True)
+            if stored is not None:
+                self.show_schedule(tomorrow, stored)
+                self.mark_stale()
+
+            await self.initialize_api()
             
             # Try to get schedule for tomorrow
             try:
-                diary = await self.api.diary(start=tomorrow, end=tomorrow)
+                diary = await fetch_diary(self.session, tomorrow, tomorrow, self.offline)
+            except OfflineCacheMiss:
+                raise
             except Exception as e:
                 if "5288" in str(e):
                     # If schedule is not available for tomorrow, show a message
@@ -545,25 +758,12 @@ class HomeworkApp(App):
                     return
                 raise e
             
-            self.query_one("#assignments-container").remove_children()
-            
-            if diary.schedule:
-                # Add date header
-                self.query_one("#assignments-container").mount(
-                    Label(f"[bold]Расписание на {tomorrow.strftime('%d.%m.%Y')}[/]", 
-                          classes="schedule-header")
-                )
-                
-                # Display each lesson
-                for day in diary.schedule:
-                    for lesson in day.lessons:
-                        display = LessonDisplay(lesson)
-                        self.query_one("#assignments-container").mount(display)
-            else:
-                self.query_one("#assignments-container").mount(
-                    Label(f"На {tomorrow.strftime('%d.%m.%Y')} нет уроков")
-                )
+            # Redraw only if the revalidated schedule differs from the stored one
+            if diary != stored:
+                self.show_schedule(tomorrow, diary)
             
+        except OfflineCacheMiss:
+            self.show_error("Нет сохраненных данных", "Эти данные еще не загружались, в автономном режиме они недоступны.")
         except errors.AuthError as e:
             self.show_error("Ошибка аутентификации", str(e))
         except errors.SchoolNotFoundError as e:
@@ -574,14 +774,175 @@ class HomeworkApp(App):
             self.show_error("Ошибка", str(e))
         finally:
             self.loading = False
+            self.mark_stale(False)
 
-    def on_unmount(self) -> None:
-        """Clean up when the app is closed."""
-        if self.api:
-            asyncio.create_task(self.api.logout())
+    @traced("load grades", "ui")
+    async def load_grade_stats(self):
+        """Show averages, trends and the marks still needed for every subject this school year."""
+        self.loading = True
+        self.begin_view("grades", "Загрузка оценок...")
+
+        try:
+            start, end = school_year_start(), date.today()
+            stored = await self.load_stored(load_grades, start, end, True)
+            if stored:
+                self.show_grade_stats(stored)
+                self.mark_stale()
+            await self.initialize_api()
+            grades = await load_grades(
+                self.session, start, end, self.offline, parser=self.report_parser, concurrency=self.concurrency
+            )
+            self.show_grade_stats(grades)
+        except OfflineCacheMiss:
+            self.show_error("Нет сохраненных данных", "Эти данные еще не загружались, в автономном режиме они недоступны.")
+        except errors.AuthError as e:
+            self.show_error("Ошибка аутентификации", str(e))
+        except httpx.ConnectError:
+            self.show_error("Ошибка подключения", "Не удалось подключиться к серверу")
+        except Exception as e:
+            self.show_error("Ошибка", str(e))
+        finally:
+            self.loading = False
+            self.mark_stale(False)
+
+    def show_grade_stats(self, grades):
+        """Render the statistics of {subject: Grades}, in place when the view is shown."""
+        container = self.query_one("#assignments-container")
+        with tracer.span("analyze", "ui", items=len(grades)):
+            stats = analyze(GradeTable.from_grades(grades, self.mark_weights), self.target_mark)
+        if not stats:
+            container.remove_children()
+            self.shown_view = None
+            container.mount(Label("Оценок пока нет"))
+            return
+        if self.shown_view == "grades":
+            self.query_one(RecordList).set_records(stats)
+            return
+        container.remove_children()
+        records = RecordList(lambda record: describe_subject(record, self.target_mark))
+        container.mount(records)
+        records.set_records(stats)
+        self.shown_view = "grades"
+
+    async def search_history(self, query):
+        """Show the synced homework matching `query`, updated as it is typed."""
+        if not query.strip():
+            self.query_one("#assignments-container").remove_children()
+            self.shown_view = None
+            return
+        if not self.session:
+            self.session = get_session(self.username, self.password, self.school, self.transport)
+        homeworks = search_homework(self.session, query)
+        self.show_homework("search", homeworks, "Ничего не найдено")
+
+    async def on_unmount(self) -> None:
+        """Clean up when the app is closed.
+
+        The token is saved for the next run unless "keep_session" is disabled
+        in the config, in which case the server session is logged out.
+        """
+        if self.view_task:
+            self.view_task.cancel()
+        await close_sessions(logout=not self.keep_session)
+        close_report_parser()
+        if self.transport:
+            await self.transport.close()
+        if self.trace_path:
+            tracer.export(self.trace_path)
+
+    def action_toggle_stats(self) -> None:
+        panel = self.query_one(StatsPanel)
+        panel.display = not panel.display
+        panel.refresh_stats()
+
+    async def load_stored(self, load, *args):
+        """Call load(session, *args) for what is stored locally; None if nothing is.
+
+        Used to show a view instantly while it is revalidated; offline the
+        real load reads the store anyway.
+        """
+        if self.offline:
+            return None
+        if not self.session:
+            self.session = get_session(self.username, self.password, self.school, self.transport)
+        try:
+            return await load(self.session, *args)
+        except Exception:
+            return None
+
+    async def show_stored_homework(self, view, load, empty_text):
+        """Render the stored homework of a view right away, unless it is already on screen."""
+        if view == self.shown_view:
+            return
+        homeworks = await self.load_stored(load, self.concurrency, True)
+        # "No homework" from an old snapshot is not worth flashing
+        if homeworks:
+            self.show_homework(view, homeworks, empty_text)
+            self.mark_stale()
+
+    def mark_stale(self, stale=True):
+        self.stale = stale
+        self.sub_title = "Обновление..." if stale else ""
+
+    def show_schedule(self, tomorrow, diary):
+        container = self.query_one("#assignments-container")
+        container.remove_children()
+        
+        lessons = [lesson for day in diary.schedule for lesson in day.lessons]
+        if lessons:
+            # Add date header
+            container.mount(
+                Label(f"[bold]Расписание на {tomorrow.strftime('%d.%m.%Y')}[/]", 
+                      classes="schedule-header")
+            )
+            
+            with tracer.span("render", "ui", items=len(lessons)):
+                records = RecordList(describe_lesson)
+                container.mount(records)
+                records.set_records(lessons)
+        else:
+            container.mount(Label(f"На {tomorrow.strftime('%d.%m.%Y')} нет уроков"))
+
+    def begin_view(self, view, loading_text="Загрузка..."):
+        """Show a loading message, unless `view` is on screen and will be updated in place."""
+        if view == self.shown_view:
+            return
+        self.shown_view = None
+        self.query_one("#assignments-container").remove_children()
+        self.query_one("#assignments-container").mount(Label(loading_text))
+
+    def show_homework(self, view, homeworks, empty_text):
+        """Render homework; when the view is already shown, its list is updated
+        in place, and only if the homework changed."""
+        container = self.query_one("#assignments-container")
+        if not homeworks:
+            container.remove_children()
+            self.shown_view = None
+            container.mount(Label(empty_text))
+            return
+        
+        count = f"Найдено заданий: {len(homeworks)}"
+        with tracer.span("render", "ui", items=len(homeworks)):
+            if view == self.shown_view:
+                records = self.query_one(RecordList)
+                if list(homeworks) != records.records:
+                    self.query_one(".homework-count", Label).update(count)
+                    records.set_records(homeworks)
+                return
+            container.remove_children()
+            container.mount(Label(count, classes="homework-count"))
+            records = RecordList(describe_homework)
+            container.mount(records)
+            records.set_records(homeworks)
+            self.shown_view = view
 
     def show_error(self, title, message):
-        """Show an error dialog."""
+        """Show an error dialog, or just a notice while stored data is on screen."""
+        if self.stale:
+            self.mark_stale(False)
+            self.notify(message, title=f"Показаны сохраненные данные. {title}", severity="warning")
+            return
+        self.shown_view = None
         self.query_one("#assignments-container").remove_children()
         self.query_one("#assignments-container").mount(Label("Произошла ошибка при загрузке заданий"))
         
@@ -589,18 +950,31 @@ class HomeworkApp(App):
         error_overlay = ErrorOverlay(title, message)
         self.mount(error_overlay)
 
-def sync_logout():
-    try:
-        with httpx.Client() as client:
-            # Make a simple POST request to the logout endpoint
-            response = client.post('https://sgo.rso23.ru/auth/logout')
-    except Exception as e:
-        print(f"Error during logout: {e}")
-
 if __name__ == "__main__":
-    app = HomeworkApp()
+    parser = argparse.ArgumentParser(description="NetSchool CLI")
+    parser.add_argument("--offline", action="store_true", help="show only locally cached data, never go online")
+    parser.add_argument("--record", metavar="CASSETTE", help="append every request and response to a cassette file (credentials scrubbed)")
+    parser.add_argument("--replay", metavar="CASSETTE", help="serve responses from a cassette file instead of the server")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="scale recorded response times on replay, 0 for no delay")
+    parser.add_argument("--trace", metavar="PATH", help="write request and phase timings on exit: Chrome trace for .json, JSON lines otherwise")
+    args = parser.parse_args()
+
+    transport = get_transport()
+    scratch = None
+    if args.replay or args.record:
+        scratch = tempfile.TemporaryDirectory(prefix="netschool-cassette-")
+        use_scratch_state(scratch.name)
+    if args.replay:
+        transport = ReplayTransport(args.replay, args.replay_speed)
+    elif args.record:
+        transport = RecordingTransport(args.record, transport)
+    # Always traced, so the stats panel (press "s") sees every request
+    transport = TracingTransport(transport)
+
+    app = HomeworkApp(offline=args.offline, transport=transport, trace_path=args.trace)
     app.title = "=== Домашние задания Сетевой Город (NetSchool) ==="
-    app.run()
-
-    if hasattr(app, 'action_quit') and app.action_quit:
-        sync_logout()
\ No newline at end of file
+    try:
+        app.run()
+    finally:
+        if scratch:
+            scratch.cleanup()
\ No newline at end of file
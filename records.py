@@ -0,0 +1,44 @@
+import datetime
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional
+
+class Homework(NamedTuple):
+    """A homework ready to be shown: subject, deadline and what to do."""
+    id: int
+    lesson: str
+    is_duty: bool
+    deadline: datetime.date
+    content: str
+    comment: Optional[str]
+
+    def to_row(self):
+        """Return a JSON-friendly row, the deadline stored as an ordinal."""
+        return (self.id, self.lesson, self.is_duty, self.deadline.toordinal(), self.content, self.comment)
+
+    @classmethod
+    def from_row(cls, row):
+        id, lesson, is_duty, deadline, content, comment = row
+        return cls(id, lesson, bool(is_duty), datetime.date.fromordinal(deadline), content, comment)
+
+class HomeworkDiff(NamedTuple):
+    """What changed between two sets of homework, by assignment id."""
+    added: List[Homework]
+    removed: List[Homework]
+    changed: List[Homework]
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+def diff_homework(old: Dict[int, Homework], new: List[Homework]) -> HomeworkDiff:
+    """Compare `new` records with the `old` ones (by id); changed ones are in their new version."""
+    new_ids = {homework.id for homework in new}
+    return HomeworkDiff(
+        [homework for homework in new if homework.id not in old],
+        [homework for id, homework in old.items() if id not in new_ids],
+        [homework for homework in new if homework.id in old and old[homework.id] != homework],
+    )
+
+@lru_cache(maxsize=512)
+def format_deadline(deadline):
+    """Format a deadline for display, e.g. '18.10 (2026)'."""
+    return deadline.strftime('%d.%m (%Y)')
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import sys
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from func import gather_limited, MAX_CONCURRENT_REQUESTS
+from cache import get_cache, OfflineCacheMiss
+from grades import Grades, DEFAULT_PARSER, parse_report
+from session import SERVER_URL
+
+# The grade report ("Отчет об успеваемости ученика") is served as HTML by the
+# old ASP part of NetSchool, outside of /webapi
+GRADES_REPORT_URL = SERVER_URL + 'asp/Reports/ReportStudentGrades.asp'
+
+PARSE_WORKERS = os.cpu_count() or 1
+
+class ReportParser:
+    """Parse grade reports on a pool of workers, off the event loop.
+
+    Parsing is CPU-bound: processes spread many reports over the cores,
+    threads only keep the event loop (and the UI) responsive. The pool is
+    started on first use.
+    """
+
+    def __init__(self, workers=PARSE_WORKERS, processes=True):
+        self.workers = max(1, workers)
+        self.processes = processes
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.processes:
+                # Forking a process that already runs threads (sqlite, the UI) is
+                # unsafe. The pool starts multiprocessing's resource tracker, which
+                # inherits stderr: under Textual that has no file, so lend it the real one
+                stderr, sys.stderr = sys.stderr, sys.__stderr__
+                try:
+                    self._executor = ProcessPoolExecutor(self.workers, multiprocessing.get_context("spawn"))
+                finally:
+                    sys.stderr = stderr
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="report-parser")
+        return self._executor
+
+    async def parse(self, html, assignment_types, has_terms=False, parser=DEFAULT_PARSER):
+        """Return the report as Grades.to_dict() data, raw HTML included."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            data = await loop.run_in_executor(executor, parse_report, html, list(assignment_types), has_terms, parser)
+        except BrokenExecutor:
+            # A worker died; start a new pool on the next call
+            if self._executor is executor:
+                self._executor = None
+            raise
+        data['raw'] = html
+        return data
+
+    async def parse_many(self, htmls, assignment_types, has_terms=False, parser=DEFAULT_PARSER):
+        """Parse several reports at once; returns the results in the same order."""
+        return await asyncio.gather(*(self.parse(html, assignment_types, has_terms, parser) for html in htmls))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+_report_parser = None
+
+def get_report_parser(workers=None, processes=None):
+    """Return the parser pool shared by the process, creating it with the given settings."""
+    global _report_parser
+    if _report_parser is None:
+        _report_parser = ReportParser(
+            PARSE_WORKERS if workers is None else workers,
+            True if processes is None else processes,
+        )
+    return _report_parser
+
+def close_report_parser():
+    global _report_parser
+    report_parser, _report_parser = _report_parser, None
+    if report_parser is not None:
+        report_parser.close()
+
+async def list_subjects(api_instance):
+    """Return {subject_id: name} for the subjects the grade report can be built for."""
+    response = await api_instance._request_with_optional_relogin(
+        None,
+        api_instance._wrapped_client.client.build_request(
+            method="POST",
+            url='reports/studentgrades/initfilters',
+            json={'params': None, 'selectedData': [
+                {'filterId': 'SID', 'filterValue': str(api_instance._student_id)},
+            ]},
+        ),
+    )
+    for source in response.json():
+        if source.get('filterId') == 'SGID':
+            return {item['value']: item['title'] for item in source['items']}
+    return {}
+
+async def fetch_report_html(api_instance, subject_id, start, end):
+    """Download the raw grade report HTML for one subject."""
+    response = await api_instance._request_with_optional_relogin(
+        None,
+        api_instance._wrapped_client.client.build_request(
+            method="POST",
+            url=GRADES_REPORT_URL,
+            data={
+                'AT': api_instance._access_token,
+                'RPTID': 'StudentGrades',
+                'SID': api_instance._student_id,
+                'SCLID': subject_id,
+                'ADT': start.strftime('%d.%m.%y'),
+                'DDT': end.strftime('%d.%m.%y'),
+            },
+        ),
+    )
+    return response.text
+
+async def fetch_grades(session, subjects, start, end, has_terms=False, parser=DEFAULT_PARSER,
+                       concurrency=MAX_CONCURRENT_REQUESTS, report_parser=None):
+    """Fetch the grade reports of several subjects concurrently over one session.
+
+    Returns {subject_id: Grades}. Reports are parsed on `report_parser`
+    (the shared pool by default) while the others are still downloading. A
+    report whose content hash matches the one stored by a previous run is
+    rebuilt from the stored parse instead of being parsed again; subjects
+    whose report failed to load are left out.
+    """
+    api_instance = await session.get_api()
+    cache = get_cache()
+    report_parser = report_parser or get_report_parser()
+    assignment_types = list(api_instance._assignment_types.values())
+
+    async def fetch(subject_id):
+        html = await fetch_report_html(api_instance, subject_id, start, end)
+        digest = hashlib.sha256(html.encode()).hexdigest()
+        stored = cache.get_report(session.account, subject_id, has_terms, digest)
+        if stored is not None:
+            return Grades.from_dict(stored, assignment_types, has_terms)
+        data = await report_parser.parse(html, assignment_types, has_terms, parser)
+        cache.put_report(session.account, subject_id, has_terms, digest, html, data)
+        return Grades.from_dict(data, assignment_types, has_terms)
+
+    subject_ids = list(subjects)
+    results = await gather_limited(fetch, subject_ids, concurrency)
+    reports = {}
+    for subject_id, result in zip(subject_ids, results):
+        if isinstance(result, Exception):
+            print(f"Error loading grade report for subject {subject_id}: {result}", file=sys.stderr)
+            continue
+        reports[subject_id] = result
+    return reports
+
+async def load_grades(session, start, end, offline=False, has_terms=False, parser=DEFAULT_PARSER,
+                      concurrency=MAX_CONCURRENT_REQUESTS):
+    """Return {subject name: Grades} for start..end.
+
+    Offline, the reports stored by the last fetch are used, whatever period
+    they were fetched for.
+    """
+    cache = get_cache()
+    if offline:
+        subjects = cache.get_meta(session.account, 'subjects')
+        if subjects is None:
+            raise OfflineCacheMiss("grade reports")
+        assignment_types = list(cache.get_meta(session.account, 'assignment_types', {}).values())
+        reports = {
+            subject_id: Grades.from_dict(data, assignment_types, has_terms)
+            for subject_id, data in cache.get_reports(session.account, has_terms).items()
+        }
+    else:
+        subjects = await list_subjects(await session.get_api())
+        # Keys become strings in JSON, like the subject ids of stored reports
+        subjects = {str(subject_id): name for subject_id, name in subjects.items()}
+        cache.put_meta(session.account, 'subjects', subjects)
+        reports = await fetch_grades(session, subjects, start, end, has_terms, parser, concurrency)
+    return {subjects[subject_id]: grades for subject_id, grades in reports.items() if subject_id in subjects}
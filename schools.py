@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import re
+import time
+import sys
+from collections import defaultdict
+import httpx
+from config import get_config_dir
+from transport import get_transport
+
+# Local snapshot of the school directory, so looking a school up by name
+# does not need the network
+SCHOOLS_FILE = os.path.join(get_config_dir(), "schools.json")
+SCHOOLS_URL = "https://sgo.rso23.ru/webapi/schools/search"
+
+# Schools rarely change; refresh the snapshot once a week, and after a failed
+# refresh wait an hour before trying again
+DIRECTORY_MAX_AGE = 7 * 24 * 60 * 60
+REFRESH_RETRY = 60 * 60
+
+# Below this score find() reports no match, so the caller can ask the server
+MIN_FIND_SCORE = 0.5
+
+def normalize(name):
+    """Lowercase a school name and drop quotes, punctuation and extra spaces."""
+    name = name.lower().replace('ё', 'е')
+    name = re.sub(r'[^\w]+', ' ', name)
+    return ' '.join(name.split())
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SchoolIndex:
+    """Trigram index over school names for ranked fuzzy lookup."""
+
+    def __init__(self, schools):
+        self.schools = schools
+        self._names = [normalize(school["shortName"]) for school in schools]
+        self._by_name = {}
+        self._exact = {}
+        self._grams = []
+        self._postings = defaultdict(list)
+        for i, name in enumerate(self._names):
+            self._by_name.setdefault(schools[i]["shortName"], i)
+            self._exact.setdefault(name, i)
+            grams = trigrams(name)
+            self._grams.append(len(grams))
+            for gram in grams:
+                self._postings[gram].append(i)
+
+    def __len__(self):
+        return len(self.schools)
+
+    def search(self, query, limit=5):
+        """Return up to `limit` schools ranked by how well their name matches."""
+        return [self.schools[i] for _, i in self._ranked(query)[:limit]]
+
+    def _ranked(self, query):
+        """Return (score, index) of every school sharing a trigram with the query, best first."""
+        query = normalize(query)
+        if not query:
+            return []
+
+        query_grams = trigrams(query)
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for i in self._postings.get(gram, ()):
+                shared[i] += 1
+
+        def score(i):
+            # Dice coefficient of the trigram sets, substrings and exact names first
+            value = 2 * shared[i] / (len(query_grams) + self._grams[i])
+            if query in self._names[i]:
+                value += 1
+            if query == self._names[i]:
+                value += 1
+            return value
+
+        return sorted(((score(i), i) for i in shared), key=lambda item: (-item[0], item[1]))
+
+    def find(self, school_name):
+        """Return the best matching school, or None if nothing is similar."""
+        # An exact short name wins, as on the server
+        i = self._by_name.get(school_name)
+        if i is None:
+            i = self._exact.get(normalize(school_name))
+        if i is not None:
+            return self.schools[i]
+        ranked = self._ranked(school_name)
+        if ranked and ranked[0][0] >= MIN_FIND_SCORE:
+            return self.schools[ranked[0][1]]
+        return None
+
+def load_snapshot():
+    """Return (fetched_at, schools) from the saved snapshot."""
+    try:
+        with open(SCHOOLS_FILE, 'r') as f:
+            snapshot = json.load(f)
+        return snapshot["fetched_at"], snapshot["schools"]
+    except (OSError, ValueError, KeyError):
+        return 0, []
+
+async def refresh_snapshot(transport=None):
+    """Download the whole school directory and save it."""
+    async with httpx.AsyncClient(transport=transport or get_transport()) as client:
+        response = await client.get(SCHOOLS_URL)
+        response.raise_for_status()
+        schools = response.json()
+    tmp_file = SCHOOLS_FILE + ".tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump({"fetched_at": time.time(), "schools": schools}, f)
+    os.replace(tmp_file, SCHOOLS_FILE)
+    return schools
+
+_index = None
+_next_refresh = 0
+_fetched_at = 0
+# Refresh in progress, shared by every caller
+_refreshing = None
+
+def current_school_index():
+    """Return the index of the saved snapshot (possibly empty), without going online."""
+    global _index, _fetched_at
+    if _index is None:
+        _fetched_at, schools = load_snapshot()
+        _index = SchoolIndex(schools)
+    return _index
+
+async def get_school_index(max_age=DIRECTORY_MAX_AGE, transport=None):
+    """Return the school index, refreshing the snapshot if it is missing or old.
+
+    Concurrent callers share one download, which goes on even if they are
+    cancelled. If the refresh fails, the old snapshot (possibly empty) is used.
+    """
+    global _next_refresh, _refreshing
+    current_school_index()
+    if not _next_refresh:
+        _next_refresh = _fetched_at + max_age
+    if time.time() >= _next_refresh:
+        if _refreshing is None:
+            _refreshing = asyncio.ensure_future(_refresh(max_age, transport))
+        await asyncio.shield(_refreshing)
+    return _index
+
+async def _refresh(max_age, transport):
+    global _index, _next_refresh, _refreshing
+    try:
+        schools = await refresh_snapshot(transport)
+    except (httpx.HTTPError, ValueError, OSError) as e:
+        print(f"Error refreshing school directory: {e}", file=sys.stderr)
+        _next_refresh = time.time() + REFRESH_RETRY
+    else:
+        _index = SchoolIndex(schools)
+        _next_refresh = time.time() + max_age
+    finally:
+        _refreshing = None
@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import httpx
+from netschoolapi import NetSchoolAPI, errors
+from func import find_school_id
+from config import get_config_dir
+from tracing import tracer
+from transport import get_transport, close_transport
+
+SERVER_URL = 'https://sgo.rso23.ru/'
+
+# Saved tokens and cookies, so a new process can skip the login handshake
+SESSION_FILE = os.path.join(get_config_dir(), "session.json")
+
+def load_states():
+    """Load all saved session states, keyed by account."""
+    try:
+        with open(SESSION_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def save_states(states):
+    """Write session states to disk, readable by the owner only."""
+    tmp_file = SESSION_FILE + ".tmp"
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(states, f)
+    os.chmod(tmp_file, 0o600)
+    os.replace(tmp_file, SESSION_FILE)
+
+def password_hash(salt, password):
+    return hashlib.sha256(f"{salt}:{password}".encode()).hexdigest()
+
+def dump_state(api):
+    """Collect what a new process needs to reuse the logged-in API."""
+    # The state is only reused with the password it was made with, so a
+    # mistyped one is checked by a real login instead of the old token
+    salt = os.urandom(16).hex()
+    return {
+        "password_salt": salt,
+        "password_hash": password_hash(salt, api._login_data[1]),
+        "at": api._access_token,
+        "student_id": api._student_id,
+        "year_id": api._year_id,
+        "school_id": api._login_data[2],
+        "assignment_types": api._assignment_types,
+        "cookies": [
+            {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path}
+            for c in api._wrapped_client.client.cookies.jar
+        ],
+    }
+
+def restore_state(api, state, user_name, password):
+    """Put a saved state back into a fresh API instance."""
+    client = api._wrapped_client.client
+    for cookie in state["cookies"]:
+        client.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"])
+    client.headers['at'] = state["at"]
+    api._access_token = state["at"]
+    api._student_id = state["student_id"]
+    api._year_id = state["year_id"]
+    api._assignment_types = {int(k): v for k, v in state["assignment_types"].items()}
+    api._login_data = (user_name, password, state["school_id"])
+
+class SharedNetSchoolAPI(NetSchoolAPI):
+    """NetSchoolAPI that can be shared by concurrent requests.
+
+    When the token expires, every request that got a 401 waits for a single
+    re-login instead of each of them logging in on its own.
+    """
+
+    def __init__(self, url):
+        super().__init__(url)
+        self._relogin_lock = None
+
+    @classmethod
+    async def create(cls, url, transport=None):
+        """Return a new instance whose requests go over `transport`, if given."""
+        api = cls(url)
+        if transport is not None:
+            # Same client as NetSchoolAPI builds, but over the given transport;
+            # the one it built is closed, its connection pool is never used
+            client = api._wrapped_client.client
+            api._wrapped_client.client = httpx.AsyncClient(
+                base_url=client.base_url,
+                headers=client.headers,
+                event_hooks=client.event_hooks,
+                transport=transport,
+            )
+            await client.aclose()
+        return api
+
+    async def _request_with_optional_relogin(self, requests_timeout, request, follow_redirects=False):
+        with tracer.span(f"{request.method} {request.url.path}", "api"):
+            return await self._request_or_relogin(requests_timeout, request, follow_redirects)
+
+    async def _request_or_relogin(self, requests_timeout, request, follow_redirects):
+        token = self._access_token
+        try:
+            return await self._wrapped_client.request(requests_timeout, request, follow_redirects)
+        except httpx.HTTPStatusError as http_status_error:
+            if http_status_error.response.status_code != httpx.codes.UNAUTHORIZED:
+                raise
+            if not self._login_data:
+                raise errors.AuthError(".login() before making requests that need authorization")
+
+        if self._relogin_lock is None:
+            self._relogin_lock = asyncio.Lock()
+        async with self._relogin_lock:
+            # Someone else may have logged in again while we were waiting
+            if self._access_token == token:
+                with tracer.span("relogin", "api"):
+                    await self.login(*self._login_data)
+
+        # The request was built with the old token
+        request.headers['at'] = self._access_token
+        return await self._wrapped_client.request(requests_timeout, request, follow_redirects)
+
+class Session:
+    """A single logged-in NetSchoolAPI (and its connection pool) shared by all views."""
+
+    def __init__(self, user_name, password, school_name_or_id, transport=None):
+        self.user_name = user_name
+        self.password = password
+        self.school = school_name_or_id
+        self.account = f"{user_name}@{school_name_or_id}"
+        self.transport = transport or get_transport()
+        self.api = None
+        self._connecting = None
+
+    async def get_api(self):
+        """Return the logged-in API, logging in on first use.
+
+        Concurrent callers share one login, which goes on even if the caller
+        that started it is cancelled.
+        """
+        if self.api is None:
+            if self._connecting is None:
+                self._connecting = asyncio.ensure_future(self._connect())
+                self._connecting.add_done_callback(lambda _: setattr(self, '_connecting', None))
+            await asyncio.shield(self._connecting)
+        return self.api
+
+    async def _connect(self):
+        with tracer.span("resume session", "login"):
+            api = await self._resume()
+        if api is None:
+            with tracer.span("login", "login"):
+                api = await self._login()
+            self.save(api)
+        self.api = api
+
+    async def _resume(self):
+        """Reuse the token saved by a previous run, if the server still accepts it."""
+        state = load_states().get(self.account)
+        if not state or state.get("password_hash") != password_hash(state.get("password_salt"), self.password):
+            return None
+
+        api = await SharedNetSchoolAPI.create(SERVER_URL, self.transport)
+        try:
+            restore_state(api, state, self.user_name, self.password)
+            # Bypass the automatic re-login: a 401 here just means "log in again"
+            await api._wrapped_client.request(None, api._wrapped_client.client.build_request(
+                method="GET", url='years/current'
+            ))
+        except (KeyError, ValueError, httpx.HTTPError, errors.NetSchoolAPIError):
+            await api._wrapped_client.client.aclose()
+            return None
+        return api
+
+    async def _login(self):
+        school = self.school
+        # Try to find the school ID if it's a string
+        if isinstance(school, str):
+            try:
+                school = await find_school_id(school, self.transport)
+            except Exception as e:
+                print(f"Error finding school ID: {e}", file=sys.stderr)
+                # Continue with the original value
+
+        api = await SharedNetSchoolAPI.create(SERVER_URL, self.transport)
+        try:
+            await api.login(self.user_name, self.password, school)
+        except BaseException:
+            await api._wrapped_client.client.aclose()
+            raise
+        return api
+
+    def save(self, api=None):
+        """Persist the current token and cookies for the next run."""
+        api = api or self.api
+        if api is None:
+            return
+        states = load_states()
+        states[self.account] = dump_state(api)
+        try:
+            save_states(states)
+        except OSError as e:
+            print(f"Error saving session: {e}", file=sys.stderr)
+
+    def forget(self):
+        """Drop the saved token for this account."""
+        states = load_states()
+        if states.pop(self.account, None) is not None:
+            save_states(states)
+
+    async def close(self, logout=False):
+        """Close the connection pool.
+
+        By default the token is saved so the next run can reuse it; with
+        logout=True the server session is ended and the saved token dropped.
+        """
+        api, self.api = self.api, None
+        if api is None:
+            return
+        try:
+            if logout:
+                self.forget()
+                await api.full_logout()
+            else:
+                self.save(api)
+                await api._wrapped_client.client.aclose()
+        except Exception as e:
+            print(f"Error during logout: {e}", file=sys.stderr)
+
+_sessions = {}
+
+def get_session(user_name, password, school_name_or_id, transport=None):
+    """Return the shared session for these credentials, creating it if needed."""
+    key = (user_name, password, str(school_name_or_id))
+    session = _sessions.get(key)
+    if session is None:
+        session = _sessions[key] = Session(user_name, password, school_name_or_id, transport)
+    return session
+
+async def close_sessions(logout=False):
+    """Close every session created by get_session, then the shared transport."""
+    sessions = list(_sessions.values())
+    _sessions.clear()
+    await asyncio.gather(*(session.close(logout) for session in sessions))
+    await close_transport()
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Keep the tests away from the real config directory, as benchmarks/run.py does
+WORKDIR = tempfile.mkdtemp(prefix="netschool-test-")
+os.environ["HOME"] = WORKDIR
+os.environ["APPDATA"] = WORKDIR
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import cache
+import func
+import session
+import transport
+from cassette import use_scratch_state
+from mock_server import MockNetSchool
+
+class EditableNetSchool(MockNetSchool):
+    """MockNetSchool whose assignments can be edited or deleted."""
+
+    def __init__(self):
+        super().__init__()
+        self.edited = {}
+        self.deleted = set()
+
+    def route(self, request, path):
+        status, body, content_type = super().route(request, path)
+        if path.endswith('/student/diary'):
+            for day in body['weekDays']:
+                for lesson in day['lessons']:
+                    for assignment in lesson['assignments']:
+                        assignment['assignmentName'] = self.edited.get(assignment['id'], assignment['assignmentName'])
+        elif isinstance(body, dict) and body.get('id') in self.deleted:
+            body['isDeleted'] = True
+        return status, body, content_type
+
+@pytest.fixture
+def server(tmp_path):
+    use_scratch_state(str(tmp_path))
+    return EditableNetSchool()
+
+def sync(server):
+    async def run():
+        s = session.Session("test", "secret", 1, transport=transport.ConditionalTransport(server.transport()))
+        try:
+            return await func.sync_homework(s, *func.current_week())
+        finally:
+            await s.close()
+    return asyncio.run(run())
+
+def expire(sql):
+    with cache.get_cache().db as db:
+        db.execute(sql)
+
+def test_first_sync_is_not_a_change(server):
+    homeworks, diff = sync(server)
+    assert homeworks
+    assert len(diff.added) == len(homeworks)
+    _, _, changed_at = cache.get_cache().get_homework("test@1", *func.current_week())
+    assert changed_at == 0
+
+def test_unchanged_resync_looks_nothing_up(server):
+    homeworks, _ = sync(server)
+    expire("UPDATE diary SET expires_at = 0")
+    server.reset()
+    again, diff = sync(server)
+    assert again == homeworks
+    assert not diff
+    assert server.paths.get('/webapi/student/diary') == 1
+    assert '/webapi/student/diary/assigns/{id}' not in server.paths
+
+def test_deleted_assignment_is_removed(server):
+    homeworks, _ = sync(server)
+    victim = homeworks[0]
+    server.deleted.add(victim.id)
+    expire("UPDATE diary SET expires_at = 0")
+    expire("UPDATE subject_groups SET checked_at = 0")
+    again, diff = sync(server)
+    assert diff.removed == [victim]
+    assert victim.id not in {homework.id for homework in again}
+    assert not diff.added and not diff.changed
+
+def test_edited_assignment_is_changed(server):
+    homeworks, _ = sync(server)
+    victim = homeworks[0]
+    server.edited[victim.id] = 'упражнения 1-5, выучить правило'
+    expire("UPDATE diary SET expires_at = 0")
+    _, diff = sync(server)
+    assert diff.changed == [victim._replace(content='упражнения 1-5, выучить правило')]
+    assert not diff.added and not diff.removed
+    _, _, changed_at = cache.get_cache().get_homework("test@1", *func.current_week())
+    assert changed_at > 0
@@ -0,0 +1,151 @@
+import asyncio
+import functools
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+import httpx
+from cassette import read_raw
+
+class Tracer:
+    """Collects timed spans: HTTP requests, API calls and pipeline phases."""
+
+    def __init__(self, max_events=20000):
+        self.max_events = max_events
+        self.events = []
+        self._origin = time.perf_counter()
+        self._tasks = {}
+        # Plain totals, e.g. revalidated responses and the bytes they saved
+        self.counters = {}
+
+    def _task_id(self):
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        # Small stable numbers read better than id() in trace viewers
+        return self._tasks.setdefault(id(task), len(self._tasks) + 1)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name, category, start, duration, args=None):
+        if len(self.events) >= self.max_events:
+            del self.events[:len(self.events) // 10]
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "start": start - self._origin,
+            "duration": duration,
+            "task": self._task_id(),
+            "args": args or {},
+        })
+
+    @contextmanager
+    def span(self, name, category="phase", **args):
+        """Time the enclosed block; extra details can be added to the yielded dict."""
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(name, category, start, time.perf_counter() - start, args)
+
+    def summary(self):
+        """Aggregate events by (category, name): count, total/max seconds, bytes and statuses.
+
+        Numeric path segments are folded, so every assignment request lands
+        under one ".../assigns/{id}" row.
+        """
+        stats = {}
+        for event in self.events:
+            key = (event["cat"], re.sub(r'/\d+(?=/|$)', '/{id}', event["name"]))
+            entry = stats.setdefault(key, {"count": 0, "total": 0.0, "max": 0.0, "bytes": 0, "statuses": {}})
+            entry["count"] += 1
+            entry["total"] += event["duration"]
+            entry["max"] = max(entry["max"], event["duration"])
+            entry["bytes"] += event["args"].get("bytes", 0)
+            status = event["args"].get("status")
+            if status is not None:
+                entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+        return stats
+
+    def export_jsonl(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for event in self.events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def export_chrome(self, path):
+        """Write the Chrome trace event format (chrome://tracing, Perfetto)."""
+        trace_events = [
+            {
+                "name": event["name"],
+                "cat": event["cat"],
+                "ph": "X",
+                "ts": event["start"] * 1e6,
+                "dur": event["duration"] * 1e6,
+                "pid": os.getpid(),
+                "tid": event["task"],
+                "args": event["args"],
+            }
+            for event in self.events
+        ]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": trace_events}, f, ensure_ascii=False)
+
+    def export(self, path):
+        """Export as a Chrome trace for .json files, as JSON lines otherwise."""
+        if path.endswith('.json'):
+            self.export_chrome(path)
+        else:
+            self.export_jsonl(path)
+
+# Process-wide tracer used by the pipeline and the UI
+tracer = Tracer()
+
+def traced(name, category="phase"):
+    """Decorate a coroutine function so every call is recorded as a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(name, category):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """Record every HTTP exchange (duration, status, payload size) to the tracer."""
+
+    def __init__(self, transport=None, tracer=tracer):
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.tracer = tracer
+
+    async def handle_async_request(self, request):
+        with self.tracer.span(f"{request.method} {request.url.path}", "http") as details:
+            response = await self.transport.handle_async_request(request)
+            content, headers = await read_raw(response)
+            details["status"] = response.status_code
+            details["bytes"] = len(content)
+            details["sent"] = len(request.content) if hasattr(request, "_content") else 0
+        return httpx.Response(
+            response.status_code,
+            headers=headers,
+            # A stream, so the body is not decoded here but by the client
+            stream=httpx.ByteStream(content),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        # Shared by every client of the session; close() really shuts it down
+        pass
+
+    async def close(self):
+        # Wrapped cassette transports have an async close() for the real shutdown
+        close = getattr(self.transport, "close", None)
+        if asyncio.iscoroutinefunction(close):
+            await close()
+        else:
+            await self.transport.aclose()
@@ -0,0 +1,126 @@
+import hashlib
+import httpx
+from cache import get_cache
+from cassette import read_raw
+from tracing import tracer
+
+# HTTP/2 needs the optional h2 package (pip install httpx[http2])
+try:
+    import h2
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# Headers of one exchange, never stored; Set-Cookie belongs to the session
+# of the moment, and replaying an old one would overwrite the current cookie
+UNSTORED_HEADERS = {
+    'connection', 'keep-alive', 'proxy-connection', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'transfer-encoding', 'upgrade', 'set-cookie',
+}
+# These describe the stored body, so a 304 does not replace them
+BODY_HEADERS = {'content-length', 'content-encoding', 'transfer-encoding'}
+
+LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+
+def make_transport(limits=LIMITS):
+    """Return a connection pool speaking HTTP/2 where the server supports it."""
+    return httpx.AsyncHTTPTransport(http2=HTTP2, limits=limits, retries=1)
+
+def cache_key(request):
+    # NetSchool sends GET requests with a JSON body, and the same URL means
+    # different data for different tokens; the token itself is not stored
+    digest = hashlib.sha256()
+    for part in (request.method, str(request.url), request.headers.get('at', '')):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(request.content)
+    return digest.hexdigest()
+
+def storable_headers(headers):
+    """Return the (name, value) pairs of a response worth keeping with its body."""
+    unstored = UNSTORED_HEADERS | {name.strip().lower() for name in headers.get('connection', '').split(',')}
+    return [(name, value) for name, value in headers.multi_items() if name.lower() not in unstored]
+
+def merge_headers(stored, fresh):
+    """Update stored headers with those of a 304 answer (RFC 9111, 4.3.4)."""
+    fresh = [(name, value) for name, value in fresh.multi_items() if name.lower() not in BODY_HEADERS]
+    updated = {name.lower() for name, _ in fresh}
+    kept = [(name, value) for name, value in stored if name.lower() not in updated | UNSTORED_HEADERS]
+    return httpx.Headers(kept + fresh)
+
+class ConditionalTransport(httpx.AsyncBaseTransport):
+    """Revalidate GET responses that carried an ETag or Last-Modified.
+
+    The body is kept in the local cache, the next identical request is sent
+    with If-None-Match / If-Modified-Since, and a 304 answer is turned back
+    into the stored response, updated with the headers of the 304. Hits and
+    saved bytes go to the tracer counters.
+    """
+
+    def __init__(self, transport=None):
+        self.transport = transport or make_transport()
+        self._closed = False
+
+    async def handle_async_request(self, request):
+        if request.method != 'GET':
+            return await self._forward(request)
+
+        await request.aread()
+        key = cache_key(request)
+        stored = get_cache().get_http(key)
+        if stored:
+            etag, last_modified, _, _ = stored
+            if etag:
+                request.headers['If-None-Match'] = etag
+            if last_modified:
+                request.headers['If-Modified-Since'] = last_modified
+
+        response = await self.transport.handle_async_request(request)
+        content, headers = await read_raw(response)
+        tracer.count("http responses")
+        tracer.count(f"http {response.extensions.get('http_version', b'HTTP/1.1').decode()}")
+        if response.status_code == 304 and stored:
+            _, _, stored_headers, body = stored
+            headers = merge_headers(stored_headers, headers)
+            tracer.count("http 304")
+            tracer.count("bytes saved", len(body))
+            get_cache().put_http(
+                key, headers.get('etag'), headers.get('last-modified'), storable_headers(headers), body
+            )
+            return httpx.Response(200, headers=headers, stream=httpx.ByteStream(body), extensions=response.extensions)
+
+        etag = headers.get('etag')
+        last_modified = headers.get('last-modified')
+        if response.status_code == 200 and (etag or last_modified):
+            get_cache().put_http(key, etag, last_modified, storable_headers(headers), content)
+        return httpx.Response(
+            response.status_code, headers=headers, stream=httpx.ByteStream(content), extensions=response.extensions
+        )
+
+    async def _forward(self, request):
+        tracer.count("http responses")
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        # Shared by every client; close() really shuts it down
+        pass
+
+    async def close(self):
+        if not self._closed:
+            self._closed = True
+            await self.transport.aclose()
+
+_transport = None
+
+def get_transport():
+    """Return the transport shared by every request of the process."""
+    global _transport
+    if _transport is None:
+        _transport = ConditionalTransport()
+    return _transport
+
+async def close_transport():
+    global _transport
+    transport, _transport = _transport, None
+    if transport is not None:
+        await transport.close()